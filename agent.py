@@ -1,13 +1,21 @@
+import os
+import json
+import hashlib
 import logging
-from typing import Dict, Any, Optional
-from api_client import APIClient
+from typing import Dict, Any, Optional, Sequence, Union
+from api_client import APIClient, run_sync
+from response_cache import ResponseCache
+from rate_limit import RateLimiter
+from metrics import technique
+from budget import Budget
+from routing import parse_api_bases
+from token_sizing import MaxTokensSizer
+from hedging import Hedger
+from strategy_model import StrategyModel, MODEL_PATH
 from techniques import ChainOfThought, SelfConsistency, ProblemDecomposition
+from cascade import Cascade
 from utils import clean_output
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 
@@ -15,56 +23,157 @@ class ReasoningAgent:
     def __init__(
         self,
         api_key: str = "cse476",
-        api_base: str = "http://10.4.58.53:41701/v1",
+        api_base: Union[str, Sequence[str]] = "http://10.4.58.53:41701/v1",
         model: str = "bens_model",
         max_calls_per_question: int = 18,
+        pool_size: int = 32,
+        warmup_connections: int = 4,
+        transport=None,
+        self_consistency_fanout: int = 5,
+        adaptive_self_consistency: bool = True,
+        cache_path: Optional[str] = None,
+        cache_all_temperatures: bool = False,
+        requests_per_second: Optional[float] = None,
+        tokens_per_second: Optional[float] = None,
+        stream_early_stop: bool = True,
+        max_tokens_per_question: Optional[int] = None,
+        max_seconds_per_question: Optional[float] = None,
+        max_calls_per_run: Optional[int] = None,
+        max_tokens_per_run: Optional[int] = None,
+        max_seconds_per_run: Optional[float] = None,
+        strategy_model_path: Optional[str] = str(MODEL_PATH),
+        strategy: Optional[str] = None,
+        cascade: bool = False,
+        cascade_logprobs: bool = False,
+        adaptive_max_tokens: bool = False,
+        max_tokens_stats_path: Optional[str] = None,
+        routing_policy: str = "least_outstanding",
+        hedge: bool = False,
+        hedge_percentile: float = 0.95,
+        hedge_max_rate: float = 0.1,
     ):
-        self.client = APIClient(api_key, api_base, model)
+        cache = None
+        if cache_path:
+            cache = ResponseCache(cache_path, deterministic_only=not cache_all_temperatures)
+        # With several replicas the concurrency ceiling is per replica
+        bases = parse_api_bases(api_base)
+        limiter = RateLimiter(
+            requests_per_second=requests_per_second,
+            tokens_per_second=tokens_per_second,
+            initial_concurrency=8 * len(bases),
+            max_concurrency=pool_size * len(bases),
+        )
+        # Adaptive sizing picks max_tokens from the completion lengths seen
+        # so far (and in earlier runs, via max_tokens_stats_path) per domain
+        # and call kind; the technique's fixed value becomes the ceiling.
+        sizer = None
+        self.max_tokens_stats_path = max_tokens_stats_path
+        if adaptive_max_tokens:
+            sizer = MaxTokensSizer()
+            if max_tokens_stats_path and os.path.exists(max_tokens_stats_path):
+                sizer.load(max_tokens_stats_path)
+        # Hedging sends a duplicate of a call that is slower than the
+        # hedge_percentile latency of its kind, for at most hedge_max_rate
+        # of all calls; the first answer is used.
+        hedger = Hedger(percentile=hedge_percentile, max_rate=hedge_max_rate) if hedge else None
+        self.client = APIClient(
+            api_key, bases, model, transport=transport, pool_size=pool_size,
+            cache=cache, limiter=limiter, sizer=sizer, routing=routing_policy, hedger=hedger
+        )
         self.max_calls = max_calls_per_question
+        self.max_tokens = max_tokens_per_question
+        self.max_seconds = max_seconds_per_question
+        # Shared by every question; its clock starts with the first question
+        self.run_budget = Budget(max_calls_per_run, max_tokens_per_run, max_seconds_per_run)
         
-        self.cot = ChainOfThought(self.client)
-        self.self_consistency = SelfConsistency(self.client)
-        self.decomposition = ProblemDecomposition(self.client)
+        # Open a few keep-alive connections in the background so the first
+        # questions do not pay TCP setup; construction does not wait on it.
+        if warmup_connections > 0:
+            self.client.warmup(warmup_connections, wait=False)
+        
+        # A trained selector replaces the keyword heuristics when its model
+        # file exists; `strategy` forces one technique for every question
+        # (e.g. to collect training labels).
+        self.strategy = strategy
+        self.strategy_model = None
+        if strategy_model_path and os.path.exists(strategy_model_path):
+            self.strategy_model = StrategyModel.load(strategy_model_path)
+            logger.info(f"Using strategy model from {strategy_model_path}")
+        
+        self.cot = ChainOfThought(self.client, early_stop=stream_early_stop)
+        self.self_consistency = SelfConsistency(
+            self.client, fanout=self_consistency_fanout, adaptive=adaptive_self_consistency
+        )
+        self.decomposition = ProblemDecomposition(self.client, early_stop=stream_early_stop)
+        # Cascade mode tries a short chain-of-thought draft first and only
+        # runs the picked technique when the draft's answer looks uncertain.
+        self.cascade = None
+        if cascade:
+            self.cascade = Cascade(self.client, early_stop=stream_early_stop, logprobs=cascade_logprobs)
         
     def solve(self, question: str, domain: Optional[str] = None) -> Dict[str, Any]:
-        self.client.reset_call_count()
+        return run_sync(self.asolve(question, domain))
+
+    async def asolve(self, question: str, domain: Optional[str] = None) -> Dict[str, Any]:
+        budget = Budget(self.max_calls, self.max_tokens, self.max_seconds, parent=self.run_budget)
+        budget.start()
+        self.client.reset_call_count(budget, domain)
         
         logger.info(f"Solving question: {question[:100]}...")
         
-        strategy = self._pick_strategy(question, domain)
+        strategy = self._fit_to_budget(self._pick_strategy(question, domain), budget)
         logger.info(f"Selected strategy: {strategy}")
         
         result = None
         
         try:
-            if strategy == "self_consistency":
-                result = self._run_self_consistency(question)
+            if self.cascade is not None and self.strategy is None:
+                result = await self._run_cascade(question, domain, strategy, budget)
+            elif strategy == "self_consistency":
+                result = await self._run_self_consistency(question)
             elif strategy == "decomposition":
-                result = self._run_decomposition(question)
+                result = await self._run_decomposition(question)
             else:
-                result = self._run_cot(question)
+                result = await self._run_cot(question)
             
         except Exception as e:
             logger.error(f"Error during solving: {e}")
-            result = self._run_cot(question)
+            result = await self._run_cot(question)
         
         final_calls = self.client.get_call_count()
+        final_samples = self.client.get_sample_count()
         final_answer = clean_output(result.get("answer", ""))
         reasoning_text = result.get("full_response", "")
         
         logger.info(f"Final answer: {final_answer}")
-        logger.info(f"Total API calls: {final_calls}")
+        logger.info(f"Total API calls: {final_calls} ({final_samples} samples)")
         
-        return {
+        output = {
             "answer": final_answer,
             "technique_used": result.get("technique", strategy),
             "call_count": final_calls,
-            "reasoning": reasoning_text
+            "sample_count": final_samples,
+            "reasoning": reasoning_text,
+            "budget": budget.stats()
         }
+        if "cascade" in result:
+            output["cascade"] = result["cascade"]
+        return output
     
 
 
+    def save_max_tokens_stats(self) -> None:
+        if self.client.sizer is not None and self.max_tokens_stats_path:
+            self.client.sizer.save(self.max_tokens_stats_path)
+
     def _pick_strategy(self, question: str, domain: Optional[str] = None) -> str:
+        if self.strategy is not None:
+            return self.strategy
+        if self.strategy_model is not None:
+            return self.strategy_model.predict(question, domain)
+        return self._heuristic_strategy(question, domain)
+
+    def _heuristic_strategy(self, question: str, domain: Optional[str] = None) -> str:
         q = question.lower()
         
         words_indicating_steps = ["first", "then", "after", "next", "finally"]
@@ -84,16 +193,107 @@ class ReasoningAgent:
         
         return "cot"
     
-    def _run_cot(self, question: str) -> Dict[str, Any]:
-        result = self.cot.solve(question)
+    def config_fingerprint(self, question: str, domain: Optional[str] = None) -> str:
+        # Hash of everything that decides how this question is answered:
+        # model, chosen strategy and that technique's prompts and sampling
+        # settings (plus chain-of-thought, which every technique falls back
+        # to). Changing one technique only changes the fingerprints of the
+        # questions routed to it.
+        strategy = self._pick_strategy(question, domain)
+        techniques = {
+            "self_consistency": self.self_consistency,
+            "decomposition": self.decomposition,
+        }
+        technique = techniques.get(strategy, self.cot)
+        # In cascade mode an uncertain draft escalates, and chain-of-thought
+        # questions escalate to self-consistency (see _run_cascade)
+        cascade = None
+        if self.cascade is not None and self.strategy is None:
+            cascade = {
+                "draft": self.cascade.config(),
+                "escalation": techniques.get(self._escalation(strategy), self.cot).config(),
+            }
+        material = json.dumps({
+            "model": self.client.model,
+            "strategy": strategy,
+            "technique": technique.config(),
+            "fallback": self.cot.config(),
+            "cascade": cascade,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+    def _fit_to_budget(self, strategy: str, budget: Budget) -> str:
+        # Downgrade to chain-of-thought when too few calls are left for the
+        # chosen technique to be worth starting.
+        if budget.exhausted():
+            logger.warning("Budget exhausted before solving; no API calls will be made")
+        calls_left = budget.remaining_calls()
+        if calls_left is None:
+            return strategy
+        if strategy == "decomposition" and calls_left < 3:
+            return "cot"
+        if strategy == "self_consistency" and calls_left < 2:
+            return "cot"
+        return strategy
+
+    @staticmethod
+    def _escalation(strategy: str) -> str:
+        # Another chain-of-thought would not settle an uncertain draft, so
+        # questions routed to it escalate to self-consistency instead
+        return "self_consistency" if strategy == "cot" else strategy
+
+    async def _run_cascade(
+        self, question: str, domain: Optional[str], strategy: str, budget: Budget
+    ) -> Dict[str, Any]:
+        with technique("cascade"):
+            draft = await self.cascade.asolve(question, domain)
+        info = {
+            "confidence": draft["confidence"],
+            "drafts": draft["drafts"],
+            "signals": draft.get("signals", {}),
+            "escalated": not draft["accepted"],
+        }
+        if draft["accepted"]:
+            return {
+                "answer": draft["answer"],
+                "technique": "cascade",
+                "full_response": draft["full_response"],
+                "cascade": info,
+            }
+
+        escalate = self._fit_to_budget(self._escalation(strategy), budget)
+        if escalate == "cot":
+            logger.info("Too few calls left to escalate; keeping the draft answer")
+            info["escalated"] = False
+            return {
+                "answer": draft["answer"],
+                "technique": "cascade",
+                "full_response": draft["full_response"],
+                "cascade": info,
+            }
+        logger.info(f"Escalating to {escalate}")
+        if escalate == "decomposition":
+            result = await self._run_decomposition(question)
+        else:
+            result = await self._run_self_consistency(question)
+        if not result["answer"]:
+            # The escalation failed outright; an uncertain answer beats none
+            result["answer"] = draft["answer"]
+        result["cascade"] = info
+        return result
+
+    async def _run_cot(self, question: str) -> Dict[str, Any]:
+        with technique("chain_of_thought"):
+            result = await self.cot.asolve(question)
         return {
             "answer": result["answer"],
             "technique": "chain_of_thought",
             "full_response": result.get("full_response", "")
         }
     
-    def _run_self_consistency(self, question: str) -> Dict[str, Any]:
-        result = self.self_consistency.solve(question)
+    async def _run_self_consistency(self, question: str) -> Dict[str, Any]:
+        with technique("self_consistency"):
+            result = await self.self_consistency.asolve(question)
         all_ans = result.get("all_answers", [])
         combined = ", ".join(all_ans)
         return {
@@ -102,8 +302,9 @@ class ReasoningAgent:
             "full_response": f"Answers: {combined}"
         }
     
-    def _run_decomposition(self, question: str) -> Dict[str, Any]:
-        result = self.decomposition.solve(question)
+    async def _run_decomposition(self, question: str) -> Dict[str, Any]:
+        with technique("decomposition"):
+            result = await self.decomposition.asolve(question)
         steps = result.get("steps", [])
         steps_text = "; ".join(steps)
         return {
@@ -1,26 +1,619 @@
 import os
 import time
-import requests
-from typing import Dict, Any
+import json
+import ssl
+import asyncio
+import threading
+import contextvars
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from urllib.request import getproxies, proxy_bypass
+from typing import Dict, Any, Optional, Tuple, Callable, AsyncIterator, Sequence, Set, Union
 import logging
+from response_cache import ResponseCache
+from rate_limit import RateLimiter, backoff_delay, parse_retry_after, is_retryable, is_overload
+from metrics import Metrics, current_technique
+from budget import Budget
+from token_sizing import MaxTokensSizer
+from routing import Backend, BackendPool, parse_api_bases
+from hedging import Hedger
 
 logger = logging.getLogger(__name__)
 
 
+class CallScope:
+    # Per-question call counter, budget and domain. Kept in a context
+    # variable so that questions solved concurrently on different threads do
+    # not share a count.
+    def __init__(self, budget: Optional[Budget] = None, domain: Optional[str] = None):
+        self.calls = 0
+        self.samples = 0
+        self.budget = budget
+        self.domain = domain
+        self._lock = threading.Lock()
+
+    def add_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def add_samples(self, n: int) -> None:
+        with self._lock:
+            self.samples += n
+
+
+_current_scope: contextvars.ContextVar = contextvars.ContextVar("api_call_scope", default=None)
+
+
+def current_scope() -> Optional[CallScope]:
+    return _current_scope.get()
+
+
+def current_budget() -> Optional[Budget]:
+    scope = _current_scope.get()
+    return scope.budget if scope is not None else None
+
+
+class _LoopThread:
+    # A single background event loop shared by every sync caller. Sync
+    # wrappers submit their coroutine here and block on the result, so all
+    # model requests from all worker threads are multiplexed on one loop.
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="api-client-loop", daemon=True
+                )
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coro):
+        loop = self._ensure_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("Sync API called from inside the client event loop; await the async variant instead")
+        return self.submit(coro).result()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+
+_loop_thread = _LoopThread()
+
+
+def run_sync(coro):
+    return _loop_thread.run(coro)
+
+
+def run_background(coro):
+    return _loop_thread.submit(coro)
+
+
+class HTTPProtocolError(Exception):
+    pass
+
+
+async def _read_head(reader: asyncio.StreamReader) -> Tuple[int, Dict[str, str]]:
+    status_line = await reader.readline()
+    if not status_line:
+        raise HTTPProtocolError("Connection closed before response")
+    parts = status_line.decode("latin-1").split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise HTTPProtocolError(f"Malformed status line: {status_line!r}")
+    status = int(parts[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip()] = value.strip()
+    return status, headers
+
+
+def _header(headers: Dict[str, str], name: str) -> Optional[str]:
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+async def _iter_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> AsyncIterator[bytes]:
+    if (_header(headers, "Transfer-Encoding") or "").lower() == "chunked":
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                # Trailer section ends with an empty line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return
+            yield await reader.readexactly(size)
+            await reader.readline()
+
+    length = _header(headers, "Content-Length")
+    if length is not None:
+        remaining = int(length)
+        while remaining > 0:
+            chunk = await reader.read(min(remaining, 1 << 16))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", remaining)
+            remaining -= len(chunk)
+            yield chunk
+        return
+
+    while True:
+        chunk = await reader.read(1 << 16)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+    return b"".join([chunk async for chunk in _iter_body(reader, headers)])
+
+
+async def iter_sse(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # Yields the data payload of each server-sent event
+    buf = b""
+    async for chunk in chunks:
+        # CRLF line endings are normalised so "\r\n\r\n" ends an event too
+        buf = (buf + chunk).replace(b"\r\n", b"\n")
+        while True:
+            end = buf.find(b"\n\n")
+            if end < 0:
+                break
+            event, buf = buf[:end], buf[end + 2:]
+            data = [line[5:].strip() for line in event.split(b"\n")
+                    if line.startswith(b"data:")]
+            if data:
+                yield b"\n".join(data).decode("utf-8")
+
+
+async def _with_timeout(chunks: AsyncIterator[bytes], timeout: float) -> AsyncIterator[bytes]:
+    # Bounds the wait for each chunk, like a socket read timeout
+    iterator = chunks.__aiter__()
+    while True:
+        try:
+            chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+        except StopAsyncIteration:
+            return
+        yield chunk
+
+
+def _keeps_alive(headers: Dict[str, str]) -> bool:
+    if (_header(headers, "Connection") or "").lower() == "close":
+        return False
+    chunked = (_header(headers, "Transfer-Encoding") or "").lower() == "chunked"
+    return chunked or _header(headers, "Content-Length") is not None
+
+
+async def _iter_deltas(
+    chunks: AsyncIterator[bytes]
+) -> AsyncIterator[Tuple[str, Optional[str], Optional[Dict[str, Any]]]]:
+    # (content delta, finish_reason, usage) for each chat.completion.chunk
+    async for event in iter_sse(chunks):
+        if event == "[DONE]":
+            return
+        chunk = json.loads(event)
+        choice = (chunk.get("choices") or [{}])[0]
+        delta = (choice.get("delta") or {}).get("content") or ""
+        yield delta, choice.get("finish_reason"), chunk.get("usage")
+
+
+class StreamError(Exception):
+    def __init__(self, status: int, error: str, headers: Dict[str, str]):
+        super().__init__(f"HTTP {status}: {error}")
+        self.status = status
+        self.error = error
+        self.headers = headers
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.uses = 0
+
+    def usable(self) -> bool:
+        return not self.writer.is_closing() and not self.reader.at_eof()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class _ConnectionPool:
+    # Keep-alive connections to one origin, owned by one event loop.
+    def __init__(self, host: str, port: int, netloc: str, secure: bool, size: int):
+        self.host = host
+        self.port = port
+        self.netloc = netloc
+        self.ssl = ssl.create_default_context() if secure else None
+        self.slots = asyncio.Semaphore(size)
+        self.idle = deque()
+        self.in_use = 0
+
+    async def open(self) -> _Connection:
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        return _Connection(reader, writer)
+
+    def take_idle(self) -> Optional[_Connection]:
+        while self.idle:
+            conn = self.idle.pop()
+            if conn.usable():
+                return conn
+            conn.close()
+        return None
+
+    def close(self) -> None:
+        while self.idle:
+            self.idle.pop().close()
+
+
+class AsyncioTransport:
+    # Default transport: HTTP/1.1 keep-alive over asyncio streams with a
+    # bounded pool of persistent connections per origin.
+    name = "asyncio"
+
+    def __init__(self, pool_size: int = 32):
+        self.pool_size = pool_size
+        self._pools = {}
+        self.requests = 0
+        self.reused = 0
+        self.connections_opened = 0
+
+    def _pool(self, url: str) -> Tuple[_ConnectionPool, str]:
+        parts = urlsplit(url)
+        secure = parts.scheme == "https"
+        port = parts.port or (443 if secure else 80)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        loop = asyncio.get_running_loop()
+        key = (loop, parts.hostname, port, secure)
+        pool = self._pools.get(key)
+        if pool is None:
+            # Connections cannot outlive the loop that opened them
+            for stale in [k for k in self._pools if k[0].is_closed()]:
+                del self._pools[stale]
+            pool = _ConnectionPool(parts.hostname, port, parts.netloc, secure, self.pool_size)
+            self._pools[key] = pool
+        return pool, path
+
+    async def _open(self, pool: _ConnectionPool) -> _Connection:
+        conn = await pool.open()
+        self.connections_opened += 1
+        return conn
+
+    async def _request(
+        self, conn: _Connection, pool: _ConnectionPool, path: str,
+        headers: Dict[str, str], body: bytes, method: str = "POST"
+    ) -> Tuple[int, Dict[str, str]]:
+        head = [f"{method} {path} HTTP/1.1", f"Host: {pool.netloc}", f"Content-Length: {len(body)}"]
+        head.extend(f"{k}: {v}" for k, v in headers.items())
+        conn.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await conn.writer.drain()
+
+        self.requests += 1
+        if conn.uses:
+            self.reused += 1
+        conn.uses += 1
+
+        return await _read_head(conn.reader)
+
+    async def _start(
+        self, pool: _ConnectionPool, path: str, headers: Dict[str, str], body: bytes,
+        method: str = "POST"
+    ) -> Tuple[_Connection, int, Dict[str, str]]:
+        conn = pool.take_idle()
+        was_idle = conn is not None
+        if conn is None:
+            conn = await self._open(pool)
+        try:
+            status, resp_headers = await self._request(conn, pool, path, headers, body, method)
+        except (OSError, asyncio.IncompleteReadError, HTTPProtocolError):
+            conn.close()
+            if not was_idle:
+                raise
+            # The server may have dropped an idle keep-alive connection;
+            # retry once on a fresh one.
+            conn = await self._open(pool)
+            try:
+                status, resp_headers = await self._request(conn, pool, path, headers, body, method)
+            except BaseException:
+                conn.close()
+                raise
+        except BaseException:
+            conn.close()
+            raise
+        return conn, status, resp_headers
+
+    @contextlib.asynccontextmanager
+    async def stream(
+        self, url: str, headers: Dict[str, str], body: bytes, method: str = "POST"
+    ) -> AsyncIterator[Tuple[int, Dict[str, str], AsyncIterator[bytes]]]:
+        # Yields (status, headers, body chunks). If the caller stops reading
+        # early the connection is closed rather than returned to the pool.
+        pool, path = self._pool(url)
+        async with pool.slots:
+            pool.in_use += 1
+            conn = None
+            finished = False
+            try:
+                conn, status, resp_headers = await self._start(pool, path, headers, body, method)
+
+                async def chunks() -> AsyncIterator[bytes]:
+                    nonlocal finished
+                    async for chunk in _iter_body(conn.reader, resp_headers):
+                        yield chunk
+                    finished = True
+
+                yield status, resp_headers, chunks()
+            finally:
+                pool.in_use -= 1
+                if conn is not None:
+                    if finished and _keeps_alive(resp_headers) and conn.usable():
+                        pool.idle.append(conn)
+                    else:
+                        conn.close()
+
+    async def post(
+        self, url: str, headers: Dict[str, str], body: bytes, timeout: float = 60
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        async with self.stream(url, headers, body) as (status, resp_headers, chunks):
+            data = b"".join([chunk async for chunk in chunks])
+        return status, resp_headers, data
+
+    async def get(self, url: str, headers: Dict[str, str], timeout: float = 10) -> Tuple[int, Dict[str, str], bytes]:
+        async with self.stream(url, headers, b"", method="GET") as (status, resp_headers, chunks):
+            data = b"".join([chunk async for chunk in chunks])
+        return status, resp_headers, data
+
+    async def warmup(self, url: str, connections: int) -> int:
+        pool, _ = self._pool(url)
+        wanted = min(connections, self.pool_size) - len(pool.idle) - pool.in_use
+        if wanted <= 0:
+            return 0
+        opened = await asyncio.gather(
+            *[self._open(pool) for _ in range(wanted)], return_exceptions=True
+        )
+        conns = [c for c in opened if isinstance(c, _Connection)]
+        pool.idle.extend(conns)
+        if len(conns) < wanted:
+            logger.warning(f"Warmup opened {len(conns)}/{wanted} connections to {pool.netloc}")
+        return len(conns)
+
+    def stats(self) -> Dict[str, Any]:
+        idle = sum(len(p.idle) for p in self._pools.values())
+        in_use = sum(p.in_use for p in self._pools.values())
+        return {
+            "transport": self.name,
+            "pool_size": self.pool_size,
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "reused": self.reused,
+            "reuse_rate": round(self.reused / self.requests, 4) if self.requests else 0.0,
+            "open_connections": idle + in_use,
+            "idle_connections": idle,
+        }
+
+
+class RequestsTransport:
+    # Alternative transport on a pooled requests.Session. Each in-flight
+    # request occupies one executor thread.
+    name = "requests"
+
+    def __init__(self, pool_size: int = 32):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="requests-transport")
+        self.in_flight = 0
+        # _post runs on executor threads
+        self._lock = threading.Lock()
+
+    def _post(self, url: str, headers: Dict[str, str], body: bytes, timeout: float):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            resp = self.session.post(url, headers=headers, data=body, timeout=timeout)
+            return resp.status_code, dict(resp.headers), resp.content
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    async def post(
+        self, url: str, headers: Dict[str, str], body: bytes, timeout: float = 60
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._post, url, headers, body, timeout)
+
+    def _get(self, url: str, headers: Dict[str, str], timeout: float):
+        resp = self.session.get(url, headers=headers, timeout=timeout)
+        return resp.status_code, dict(resp.headers), resp.content
+
+    async def get(self, url: str, headers: Dict[str, str], timeout: float = 10) -> Tuple[int, Dict[str, str], bytes]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._get, url, headers, timeout)
+
+    async def warmup(self, url: str, connections: int) -> int:
+        # urllib3 opens connections lazily; there is nothing useful to
+        # pre-open without sending a request.
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        requests_sent = 0
+        opened = 0
+        idle = 0
+        for key in self._adapter.poolmanager.pools.keys():
+            pool = self._adapter.poolmanager.pools[key]
+            requests_sent += pool.num_requests
+            opened += pool.num_connections
+            idle += sum(1 for c in list(pool.pool.queue) if c is not None)
+        reused = max(requests_sent - opened, 0)
+        with self._lock:
+            in_flight = self.in_flight
+        return {
+            "transport": self.name,
+            "pool_size": self.pool_size,
+            "requests": requests_sent,
+            "connections_opened": opened,
+            "reused": reused,
+            "reuse_rate": round(reused / requests_sent, 4) if requests_sent else 0.0,
+            "open_connections": idle + in_flight,
+            "idle_connections": idle,
+        }
+
+
+TRANSPORTS = ("asyncio", "requests")
+
+
+def proxy_for(url: str) -> Optional[str]:
+    # The proxy HTTP(S)_PROXY / NO_PROXY route this URL through, if any
+    parts = urlsplit(url)
+    proxy = getproxies().get(parts.scheme)
+    if proxy is None or proxy_bypass(parts.hostname or ""):
+        return None
+    return proxy
+
+
+def make_transport(name: Optional[str], urls: Sequence[str], pool_size: int = 32):
+    # AsyncioTransport does not speak to proxies, so unless a transport is
+    # named, URLs that go through a proxy get RequestsTransport (which
+    # honours the proxy environment like the original requests.post client).
+    if name is None:
+        proxied = [u for u in urls if proxy_for(u)]
+        if proxied:
+            logger.info(f"Using the requests transport: {proxied[0]} goes through {proxy_for(proxied[0])}")
+            name = "requests"
+    if name == "requests":
+        return RequestsTransport(pool_size)
+    if name in (None, "asyncio"):
+        return AsyncioTransport(pool_size)
+    raise ValueError(f"Unknown transport {name!r}; expected one of {TRANSPORTS}")
+
+
+def _truncated(result: Dict[str, Any]) -> bool:
+    if not result["ok"] or result.get("stopped_early"):
+        return False
+    return any(c.get("finish_reason") == "length" for c in (result["raw"] or {}).get("choices") or [])
+
+
 class APIClient:
     def __init__(
         self,
         api_key: str = "cse476",
-        api_base: str = "http://10.4.58.53:41701/v1",
+        api_base: Union[str, Sequence[str]] = "http://10.4.58.53:41701/v1",
         model: str = "bens_model",
         max_retries: int = 3,
+        transport=None,
+        pool_size: int = 32,
+        cache: Optional[ResponseCache] = None,
+        limiter: Optional[RateLimiter] = None,
+        metrics: Optional[Metrics] = None,
+        sizer: Optional[MaxTokensSizer] = None,
+        routing: str = "least_outstanding",
+        hedger: Optional[Hedger] = None,
     ):
         self.api_key = api_key
-        self.api_base = api_base
+        # api_base may list several replicas of the same model (a sequence
+        # or comma-separated); each request goes to the one picked by the
+        # routing policy. api_base/url keep naming the first one.
+        self.backends = BackendPool(parse_api_bases(api_base), routing)
+        self.api_base = self.backends.backends[0].base
         self.model = model
         self.max_retries = max_retries
         self.call_count = 0
-        
+        self.sample_count = 0
+        self._count_lock = threading.Lock()
+        # Whether the server honours the OpenAI "n" parameter; None until
+        # the first multi-sample request tells us.
+        self.supports_n: Optional[bool] = None
+
+        self.cache = cache
+        self.limiter = limiter if limiter is not None else RateLimiter(max_concurrency=pool_size)
+        # transport is an instance, a name from TRANSPORTS, or None to pick
+        # by the proxy environment
+        if transport is None or isinstance(transport, str):
+            transport = make_transport(transport, [b.url for b in self.backends.backends], pool_size)
+        self.transport = transport
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.sizer = sizer
+        self.hedger = hedger
+        self.url = self.backends.backends[0].url
+        self.headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def warmup(self, connections: int = 4, wait: bool = True) -> None:
+        coro = self._warmup(connections)
+        if wait:
+            run_sync(coro)
+        else:
+            run_background(coro)
+
+    async def _warmup(self, connections: int) -> None:
+        await asyncio.gather(*[self.transport.warmup(b.url, connections) for b in self.backends.backends])
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return self.transport.stats()
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self.cache.stats() if self.cache is not None else None
+
+    def metrics_stats(self) -> Dict[str, Any]:
+        return self.metrics.to_dict()
+
+    def backend_stats(self) -> Dict[str, Any]:
+        return self.backends.stats()
+
+    def hedge_stats(self) -> Optional[Dict[str, Any]]:
+        return self.hedger.stats() if self.hedger is not None else None
+
+    def _check_backends(self) -> None:
+        # Health-check backends whose cooldown is over, in the background
+        for backend in self.backends.due_for_check():
+            asyncio.ensure_future(self._health_check(backend))
+
+    async def _health_check(self, backend: Backend, timeout: float = 5.0) -> None:
+        healthy = False
+        try:
+            if hasattr(self.transport, "get"):
+                status, _, _ = await asyncio.wait_for(
+                    self.transport.get(f"{backend.base}/models", self.headers, timeout), timeout
+                )
+            else:
+                # Transports without GET: a one-token completion instead
+                body = self._body("ping", "You are a helpful assistant.", 0.0, 1)
+                status, _, _ = await asyncio.wait_for(
+                    self.transport.post(backend.url, self.headers, body, timeout), timeout
+                )
+            healthy = status < 500
+        except (asyncio.TimeoutError, OSError, HTTPProtocolError) as e:
+            logger.debug(f"Health check of {backend.base} failed: {e!r}")
+        finally:
+            self.backends.check_result(backend, healthy)
+
     def call(
         self,
         prompt: str,
@@ -28,12 +621,368 @@ class APIClient:
         temperature: float = 0.0,
         max_tokens: int = 1024,
         timeout: int = 60,
+        n: int = 1,
+        use_cache: bool = True,
+        stop_when: Optional[Callable[[str], bool]] = None,
+        logprobs: bool = False,
+        size_as: Optional[str] = None,
+        sample: int = 0,
     ) -> Dict[str, Any]:
-        url = f"{self.api_base}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
+        return run_sync(self.acall(
+            prompt, system=system, temperature=temperature,
+            max_tokens=max_tokens, timeout=timeout, n=n, use_cache=use_cache,
+            stop_when=stop_when, logprobs=logprobs, size_as=size_as, sample=sample
+        ))
+
+    async def acall(
+        self,
+        prompt: str,
+        system: str = "You are a helpful assistant.",
+        temperature: float = 0.0,
+        max_tokens: int = 1024,
+        timeout: int = 60,
+        n: int = 1,
+        use_cache: bool = True,
+        stop_when: Optional[Callable[[str], bool]] = None,
+        logprobs: bool = False,
+        size_as: Optional[str] = None,
+        sample: int = 0,
+    ) -> Dict[str, Any]:
+        # size_as names the kind of call (e.g. "step") whose observed
+        # completion lengths size max_tokens when the client has a sizer.
+        # max_tokens is then only the ceiling, used again if the sized
+        # request is cut off.
+        kwargs = dict(
+            system=system, temperature=temperature, timeout=timeout, n=n,
+            use_cache=use_cache, stop_when=stop_when, logprobs=logprobs, kind=size_as, sample=sample
+        )
+        if size_as is None or self.sizer is None:
+            return await self._acall(prompt, max_tokens=max_tokens, **kwargs)
+
+        scope = _current_scope.get()
+        domain = scope.domain if scope is not None else None
+        sized = self.sizer.size(domain, size_as, max_tokens)
+        result = await self._acall(prompt, max_tokens=sized, cache_max_tokens=max_tokens, **kwargs)
+        # A retry that the token budget would cut down again is not worth a call
+        budget = current_budget()
+        ceiling = max_tokens
+        if budget is not None:
+            ceiling = budget.cap_max_tokens(max_tokens, (len(system) + len(prompt)) // 4)
+        if sized < ceiling and _truncated(result):
+            self.sizer.record_truncation(domain, size_as)
+            logger.info(f"{size_as} completion cut off at {sized} tokens; retrying with {max_tokens}")
+            retry = await self._acall(prompt, max_tokens=max_tokens, **kwargs)
+            if not retry["ok"]:
+                return result
+            result = retry
+        if result["ok"] and not result.get("cached"):
+            usage = result["raw"].get("usage") or {}
+            if "completion_tokens" in usage:
+                self.sizer.observe(domain, size_as, usage["completion_tokens"] // max(1, len(result["texts"])))
+        return result
+
+    async def _acall(
+        self,
+        prompt: str,
+        system: str = "You are a helpful assistant.",
+        temperature: float = 0.0,
+        max_tokens: int = 1024,
+        timeout: int = 60,
+        n: int = 1,
+        use_cache: bool = True,
+        stop_when: Optional[Callable[[str], bool]] = None,
+        logprobs: bool = False,
+        cache_max_tokens: Optional[int] = None,
+        kind: Optional[str] = None,
+        sample: int = 0,
+    ) -> Dict[str, Any]:
+        # cache_max_tokens is the ceiling of a sized request: a response that
+        # was not cut off is the same as the ceiling would have produced, so
+        # it is cached under the ceiling. stop_when switches to a streamed request that is cut off as soon as
+        # the predicate holds for the text received so far. logprobs asks
+        # for token log probabilities (in "raw"; non-streamed requests only).
+        # sample is the index of the (first) sample this call draws when a
+        # caller samples one prompt several times; it keeps those samples
+        # apart in the cache so a re-run replays each one.
+        streaming = stop_when is not None and n == 1 and hasattr(self.transport, "stream")
+        budget = current_budget()
+        # A stopped-early completion is only reused by calls that stop the same way
+        stop = getattr(stop_when, "__name__", repr(stop_when)) if streaming else None
+        cache_key = None
+        if self.cache is not None and use_cache and self.cache.cacheable(temperature):
+            cache_key = ResponseCache.make_key(
+                self.model, system, prompt, temperature, cache_max_tokens or max_tokens, n, sample, stop
+            )
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                self.metrics.record_cache_hit()
+                choices = cached["raw"].get("choices") or [{}]
+                return {
+                    "ok": True,
+                    "text": cached["texts"][0],
+                    "texts": cached["texts"],
+                    "raw": cached["raw"],
+                    "status": 200,
+                    "error": None,
+                    "headers": {},
+                    "finish_reason": choices[0].get("finish_reason"),
+                    "stopped_early": cached["raw"].get("stopped_early", False),
+                    "cached": True
+                }
+
+        # Rough prompt size for the token bucket; the completion is charged
+        # once the server reports usage.
+        estimated_tokens = (len(system) + len(prompt)) // 4
+
+        # Never ask for a longer completion than the token budget has left
+        if budget is not None:
+            capped = max(1, budget.cap_max_tokens(max_tokens, estimated_tokens))
+            if capped < max_tokens:
+                max_tokens = capped
+                cache_max_tokens = None
+                if cache_key is not None:
+                    cache_key = ResponseCache.make_key(
+                        self.model, system, prompt, temperature, max_tokens, n, sample, stop
+                    )
+
+        body = self._body(prompt, system, temperature, max_tokens, n, stream=streaming, logprobs=logprobs)
+        result = self._failure(-1, "Max retries exceeded", {})
+        retry_after = None
+        # Backends that failed this call; retries go to another one if any
+        failed: Set[Backend] = set()
+        kind = kind or current_technique()
+        self._check_backends()
+
+        for attempt in range(self.max_retries):
+            if attempt:
+                delay = backoff_delay(attempt - 1, retry_after)
+                remaining = budget.remaining_seconds() if budget is not None else None
+                if remaining is not None and delay >= remaining:
+                    break
+                await asyncio.sleep(delay)
+
+            # Every attempt, retries included, is charged to the budget
+            if budget is not None and not budget.take_call(estimated_tokens):
+                if attempt == 0:
+                    result = self._failure(-1, "Budget exhausted", {})
+                break
+            attempt_timeout = timeout
+            if budget is not None and budget.remaining_seconds() is not None:
+                attempt_timeout = min(timeout, budget.remaining_seconds())
+
+            await self.limiter.acquire(estimated_tokens)
+            backend = self.backends.pick(exclude=failed)
+            self.backends.start(backend)
+            started = time.monotonic()
+            try:
+                self._count_call()
+                # A hedged request answers from whichever backend was first
+                backend, started, status, hdrs, content, data = await asyncio.wait_for(
+                    self._post_hedged(
+                        backend, body, streaming, stop_when, attempt_timeout, kind, budget, estimated_tokens
+                    ),
+                    attempt_timeout
+                )
+            except asyncio.TimeoutError:
+                self.limiter.release(None, overloaded=True)
+                self.backends.finish(backend, False)
+                failed.add(backend)
+                self.metrics.record_request(-1, time.monotonic() - started, retry=attempt > 0)
+                result = self._failure(-1, "Request timed out", {})
+                retry_after = None
+                continue
+            except (OSError, HTTPProtocolError) as e:
+                self.limiter.release(None)
+                self.backends.finish(backend, False)
+                failed.add(backend)
+                self.metrics.record_request(-1, time.monotonic() - started, retry=attempt > 0)
+                result = self._failure(-1, str(e) or type(e).__name__, {})
+                retry_after = None
+                continue
+            except BaseException:
+                self.limiter.release(None)
+                self.backends.finish(backend, None)
+                raise
+            latency = time.monotonic() - started
+
+            if status == 200:
+                try:
+                    if data is None:
+                        data = json.loads(content)
+                except ValueError as e:
+                    self.limiter.release(None)
+                    self.backends.finish(backend, False)
+                    failed.add(backend)
+                    self.metrics.record_request(status, latency, retry=attempt > 0)
+                    result = self._failure(-1, f"Invalid JSON response: {e}", hdrs)
+                    retry_after = None
+                    continue
+                usage = data.get("usage") or {}
+                completion_tokens = usage.get("completion_tokens", 0)
+                self.backends.finish(backend, True, latency / max(1, completion_tokens))
+                self.limiter.charge_tokens(completion_tokens)
+                if budget is not None:
+                    budget.charge_tokens(usage.get("prompt_tokens", estimated_tokens) + completion_tokens)
+                # Completion lengths vary a lot, so the limiter watches
+                # latency per generated token as its queueing signal.
+                self.limiter.release(latency / max(1, completion_tokens))
+                self.metrics.record_request(
+                    status, latency, retry=attempt > 0,
+                    prompt_tokens=usage.get("prompt_tokens", estimated_tokens),
+                    completion_tokens=completion_tokens
+                )
+
+                choices = data.get("choices") or [{}]
+                texts = [c.get("message", {}).get("content", "") for c in choices]
+                stopped_early = data.get("stopped_early", False)
+                self._count_samples(len(texts))
+                if n > 1:
+                    self.supports_n = len(texts) >= n
+                # A sized completion that was cut off is not what the
+                # ceiling would have produced
+                cut_off = cache_max_tokens is not None and any(
+                    c.get("finish_reason") == "length" for c in choices
+                )
+                if cache_key is not None and not cut_off:
+                    await self.cache.aput(cache_key, {"texts": texts, "raw": data})
+                return {
+                    "ok": True,
+                    "text": texts[0],
+                    "texts": texts,
+                    "raw": data,
+                    "status": status,
+                    "error": None,
+                    "headers": hdrs,
+                    "finish_reason": choices[0].get("finish_reason"),
+                    "stopped_early": stopped_early
+                }
+
+            # Only 200s feed the latency signal, which is per generated token;
+            # a quick 400 would otherwise read as a huge latency jump
+            self.limiter.release(None, overloaded=is_overload(status))
+            # A 5xx counts against the backend; a 4xx (429 included) is about
+            # the request or the rate, not the backend's health
+            self.backends.finish(backend, False if status >= 500 else None)
+            if is_retryable(status):
+                failed.add(backend)
+            self.metrics.record_request(status, latency, retry=attempt > 0)
+            err_text = None
+            try:
+                err_text = json.loads(content)
+            except ValueError:
+                err_text = content.decode("utf-8", errors="replace")
+            result = self._failure(status, str(err_text), hdrs)
+
+            # A client error on a multi-sample request means the server does
+            # not accept "n"; retrying will not help.
+            if n > 1 and status in (400, 422):
+                self.supports_n = False
+                return result
+            if not is_retryable(status):
+                return result
+            retry_after = parse_retry_after(_header(hdrs, "Retry-After"))
+
+        return result
+
+    async def _post_once(
+        self, url: str, body: bytes, streaming: bool, stop_when: Optional[Callable[[str], bool]], timeout: float
+    ) -> Tuple[int, Dict[str, str], bytes, Optional[Dict[str, Any]]]:
+        if streaming:
+            return await self._post_streaming(url, body, stop_when)
+        status, hdrs, content = await self.transport.post(url, self.headers, body, timeout)
+        return status, hdrs, content, None
+
+    async def _post_hedged(
+        self,
+        backend: Backend,
+        body: bytes,
+        streaming: bool,
+        stop_when: Optional[Callable[[str], bool]],
+        timeout: float,
+        kind: str,
+        budget: Optional[Budget],
+        estimated_tokens: int,
+    ) -> Tuple[Backend, float, int, Dict[str, str], bytes, Optional[Dict[str, Any]]]:
+        # Sends the request to `backend`. With a hedger, a request that has
+        # not answered within its kind's hedge delay gets a duplicate on the
+        # least loaded other backend (or the same one), charged to the
+        # budget like any call; the first 200 wins and the other request is
+        # cancelled and accounted for here. Hedges bypass the concurrency
+        # limiter, which the hedger's rate cap stands in for. Returns the
+        # answering backend, when its request was sent, and the response.
+        started = time.monotonic()
+        delay = self.hedger.delay(kind, streaming) if self.hedger is not None else None
+        if delay is None:
+            response = await self._post_once(backend.url, body, streaming, stop_when, timeout)
+            if self.hedger is not None and response[0] == 200:
+                self.hedger.observe(kind, streaming, time.monotonic() - started)
+            return (backend, started) + response
+
+        primary = asyncio.ensure_future(self._post_once(backend.url, body, streaming, stop_when, timeout))
+        # Requests that are cancelled or accounted for on the way out; the
+        # caller settles the one returned (or the primary, if both fail)
+        unsettled: Dict[asyncio.Future, Tuple[Backend, float]] = {}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self.hedger.allow() or (budget is not None and not budget.take_call(estimated_tokens)):
+                response = await primary
+                if response[0] == 200:
+                    self.hedger.observe(kind, streaming, time.monotonic() - started)
+                return (backend, started) + response
+
+            self.hedger.record_hedge()
+            hedge_backend = self.backends.pick(exclude={backend})
+            self.backends.start(hedge_backend)
+            self._count_call()
+            logger.debug(f"Hedging a {kind} request to {hedge_backend.base} after {delay:.2f}s")
+            hedge = asyncio.ensure_future(self._post_once(hedge_backend.url, body, streaming, stop_when, timeout))
+            sent = {primary: (backend, started), hedge: (hedge_backend, time.monotonic())}
+            unsettled[hedge] = sent[hedge]
+
+            pending = {primary, hedge}
+            winner = None
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in done if t.exception() is None and t.result()[0] == 200), None)
+            if winner is None:
+                self.metrics.record_hedge(False)
+                return (backend, started) + primary.result()
+
+            self.hedger.observe(kind, streaming, time.monotonic() - started)
+            self.metrics.record_hedge(winner is hedge)
+            if winner is hedge:
+                self.hedger.record_win()
+                del unsettled[hedge]
+                unsettled[primary] = sent[primary]
+            return sent[winner] + winner.result()
+        finally:
+            if primary not in unsettled and not primary.done():
+                primary.cancel()
+            for task, (loser, sent_at) in unsettled.items():
+                self._settle(task, loser, sent_at)
+
+    def _settle(self, task: asyncio.Future, backend: Backend, sent_at: float) -> None:
+        # Cancels or records the losing request of a hedged pair
+        if not task.done():
+            task.cancel()
+            self.backends.finish(backend, None)
+            return
+        latency = time.monotonic() - sent_at
+        if task.cancelled():
+            self.backends.finish(backend, None)
+        elif task.exception() is not None:
+            no_response = isinstance(task.exception(), (OSError, HTTPProtocolError, asyncio.TimeoutError))
+            self.backends.finish(backend, False if no_response else None)
+            self.metrics.record_request(-1, latency)
+        else:
+            status = task.result()[0]
+            self.backends.finish(backend, False if status >= 500 else None)
+            self.metrics.record_request(status, latency)
+
+    def _body(
+        self, prompt: str, system: str, temperature: float, max_tokens: int,
+        n: int = 1, stream: bool = False, logprobs: bool = False
+    ) -> bytes:
         payload = {
             "model": self.model,
             "messages": [
@@ -43,70 +992,181 @@ class APIClient:
             "temperature": temperature,
             "max_tokens": max_tokens,
         }
-        
-        for attempt in range(self.max_retries):
-            try:
-                self.call_count += 1
-                resp = requests.post(url, headers=headers, json=payload, timeout=timeout)
-                status = resp.status_code
-                hdrs = dict(resp.headers)
-                
-                if status == 200:
-                    data = resp.json()
-                    text = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-                    return {
-                        "ok": True,
-                        "text": text,
-                        "raw": data,
-                        "status": status,
-                        "error": None,
-                        "headers": hdrs
-                    }
-                else:
-                    err_text = None
-                    try:
-                        err_text = resp.json()
-                    except Exception:
-                        err_text = resp.text
-                    
-                    if attempt < self.max_retries - 1:
-                        time.sleep(1.0)
-                        continue
-                    
-                    return {
-                        "ok": False,
-                        "text": None,
-                        "raw": None,
-                        "status": status,
-                        "error": str(err_text),
-                        "headers": hdrs
-                    }
-                    
-            except requests.RequestException as e:
-                if attempt < self.max_retries - 1:
-                    time.sleep(1.0)
-                    continue
-                
-                return {
-                    "ok": False,
-                    "text": None,
-                    "raw": None,
-                    "status": -1,
-                    "error": str(e),
-                    "headers": {}
-                }
-        
+        if n > 1:
+            payload["n"] = n
+        if logprobs:
+            payload["logprobs"] = True
+        if stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+        return json.dumps(payload).encode("utf-8")
+
+    async def _post_streaming(
+        self, url: str, body: bytes, stop_when: Callable[[str], bool]
+    ) -> Tuple[int, Dict[str, str], bytes, Optional[Dict[str, Any]]]:
+        # Returns the same shape of data as a non-streamed completion so the
+        # caller does not need to care which path was taken.
+        async with self.transport.stream(url, self.headers, body) as (status, hdrs, chunks):
+            # Errors, and servers that ignore "stream", come back as plain JSON
+            content_type = _header(hdrs, "Content-Type") or ""
+            if status != 200 or "text/event-stream" not in content_type:
+                content = b"".join([chunk async for chunk in chunks])
+                return status, hdrs, content, None
+
+            text = ""
+            finish_reason = None
+            usage = None
+            stopped_early = False
+            async for delta, reason, chunk_usage in _iter_deltas(chunks):
+                text += delta
+                finish_reason = reason or finish_reason
+                usage = chunk_usage or usage
+                if delta and stop_when(text):
+                    stopped_early = True
+                    break
+            else:
+                # Read up to the end of the body so the connection can be reused
+                async for _ in chunks:
+                    pass
+
+        if usage is None:
+            usage = {"completion_tokens": len(text) // 4}
+        data = {
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop" if stopped_early else finish_reason,
+            }],
+            "usage": usage,
+            "stopped_early": stopped_early,
+        }
+        return status, hdrs, b"", data
+
+    async def astream(
+        self,
+        prompt: str,
+        system: str = "You are a helpful assistant.",
+        temperature: float = 0.0,
+        max_tokens: int = 1024,
+        timeout: float = 60,
+    ) -> AsyncIterator[str]:
+        # Yields content deltas as they arrive. Single attempt: a failed
+        # request raises StreamError instead of being retried, since text
+        # may already have been handed to the caller. `timeout` bounds the
+        # wait for the response and for each chunk after it, like a socket
+        # read timeout, and raises asyncio.TimeoutError. A transport that
+        # cannot stream gets a plain request whose text is yielded at once.
+        budget = current_budget()
+        if budget is not None:
+            max_tokens = max(1, budget.cap_max_tokens(max_tokens, (len(system) + len(prompt)) // 4))
+            if not budget.take_call((len(system) + len(prompt)) // 4):
+                raise StreamError(-1, "Budget exhausted", {})
+        streaming = hasattr(self.transport, "stream")
+        body = self._body(prompt, system, temperature, max_tokens, stream=streaming)
+        await self.limiter.acquire((len(system) + len(prompt)) // 4)
+        self._check_backends()
+        backend = self.backends.pick()
+        self.backends.start(backend)
+        started = time.monotonic()
+        completion_tokens = 0
+        overloaded = False
+        status = -1
+        healthy = None
+        try:
+            self._count_call()
+            if not streaming:
+                status, hdrs, content = await asyncio.wait_for(
+                    self.transport.post(backend.url, self.headers, body, timeout), timeout
+                )
+                if status != 200:
+                    overloaded = is_overload(status)
+                    raise StreamError(status, content.decode("utf-8", errors="replace"), hdrs)
+                self._count_samples(1)
+                data = json.loads(content)
+                completion_tokens = (data.get("usage") or {}).get("completion_tokens", 0)
+                text = data["choices"][0]["message"]["content"] or ""
+                if text:
+                    yield text
+            else:
+                async with contextlib.AsyncExitStack() as stack:
+                    status, hdrs, chunks = await asyncio.wait_for(
+                        stack.enter_async_context(self.transport.stream(backend.url, self.headers, body)), timeout
+                    )
+                    chunks = _with_timeout(chunks, timeout)
+                    if status != 200:
+                        overloaded = is_overload(status)
+                        content = b"".join([chunk async for chunk in chunks])
+                        raise StreamError(status, content.decode("utf-8", errors="replace"), hdrs)
+                    self._count_samples(1)
+                    async for delta, _, usage in _iter_deltas(chunks):
+                        if usage:
+                            completion_tokens = usage.get("completion_tokens", 0)
+                        if delta:
+                            yield delta
+                    async for _ in chunks:
+                        pass
+            healthy = True
+        except (OSError, HTTPProtocolError, asyncio.TimeoutError) as e:
+            healthy = False
+            overloaded = isinstance(e, asyncio.TimeoutError)
+            raise
+        finally:
+            if status >= 500:
+                healthy = False
+            self.limiter.charge_tokens(completion_tokens)
+            if budget is not None:
+                budget.charge_tokens((len(system) + len(prompt)) // 4 + completion_tokens)
+            latency = time.monotonic() - started
+            self.backends.finish(
+                backend, healthy, latency / max(1, completion_tokens) if healthy else None
+            )
+            self.limiter.release(
+                latency / max(1, completion_tokens) if status == 200 else None, overloaded=overloaded
+            )
+            self.metrics.record_request(
+                status, latency, prompt_tokens=(len(system) + len(prompt)) // 4,
+                completion_tokens=completion_tokens
+            )
+
+    @staticmethod
+    def _failure(status: int, error: str, headers: Dict[str, str]) -> Dict[str, Any]:
         return {
             "ok": False,
             "text": None,
             "raw": None,
-            "status": -1,
-            "error": "Max retries exceeded",
-            "headers": {}
+            "status": status,
+            "error": error,
+            "headers": headers
         }
-    
+
+    def _count_call(self) -> None:
+        with self._count_lock:
+            self.call_count += 1
+        scope = _current_scope.get()
+        if scope is not None:
+            scope.add_call()
+
+    def _count_samples(self, n: int) -> None:
+        with self._count_lock:
+            self.sample_count += n
+        scope = _current_scope.get()
+        if scope is not None:
+            scope.add_samples(n)
+
     def get_call_count(self) -> int:
+        scope = _current_scope.get()
+        if scope is not None:
+            return scope.calls
         return self.call_count
-    
-    def reset_call_count(self) -> None:
-        self.call_count = 0
+
+    def get_sample_count(self) -> int:
+        scope = _current_scope.get()
+        if scope is not None:
+            return scope.samples
+        return self.sample_count
+
+    def reset_call_count(self, budget: Optional[Budget] = None, domain: Optional[str] = None) -> None:
+        # Starts a fresh count (and optionally a budget and domain) for the
+        # current thread/context only; self.call_count keeps the running
+        # total across all questions.
+        _current_scope.set(CallScope(budget, domain))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List, Dict, Any
+
+from utils import extract_final_answer, _extract_final_answer, clean_output
+
+GOLDEN_PATH = Path("extraction_golden.json")
+
+
+def load_golden(path: Path) -> List[Dict[str, Any]]:
+    with path.open("r", encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def check(cases: List[Dict[str, Any]]) -> int:
+    # Every case records what the original extraction code produced; any
+    # difference is a behaviour change, not just a speed change.
+    failures = 0
+    for i, case in enumerate(cases):
+        got = _extract_final_answer(case["text"])
+        if got != case["extract"]:
+            failures += 1
+            print(f"case {i}: extract_final_answer {got!r} != {case['extract']!r}")
+        got = clean_output(case["text"])
+        if got != case["clean"]:
+            failures += 1
+            print(f"case {i}: clean_output {got!r} != {case['clean']!r}")
+    print(f"{len(cases) - failures}/{len(cases)} golden cases match" if not failures
+          else f"{failures} mismatches in {len(cases)} golden cases")
+    return failures
+
+
+def bench(name: str, fn, texts: List[str], rounds: int) -> None:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            fn(text)
+    elapsed = time.perf_counter() - start
+    total = rounds * len(texts)
+    print(f"{name:<28} {total / elapsed:>12,.0f} texts/s  {elapsed / total * 1e6:>8.1f} us/text")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Check and benchmark answer extraction.")
+    parser.add_argument("--golden", type=Path, default=GOLDEN_PATH,
+                        help=f"Golden corpus (default: {GOLDEN_PATH})")
+    parser.add_argument("--rounds", type=int, default=20,
+                        help="Passes over the corpus per benchmark (default: 20)")
+    parser.add_argument("--check", action="store_true",
+                        help="Only verify the golden outputs; exit non-zero on any mismatch")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cases = load_golden(args.golden)
+    failures = check(cases)
+    if args.check:
+        sys.exit(1 if failures else 0)
+
+    texts = [case["text"] for case in cases]
+    bench("extract_final_answer", _extract_final_answer, texts, args.rounds)
+    extract_final_answer.cache_clear()
+    bench("extract_final_answer (memo)", extract_final_answer, texts, args.rounds)
+    bench("clean_output (memo)", clean_output, texts, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
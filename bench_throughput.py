@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+
+import argparse
+import json
+import logging
+import math
+import random
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from agent import ReasoningAgent
+from mock_server import MockServer, add_behaviour_args, behaviour_from_args
+import main_script
+import evaluation
+
+logger = logging.getLogger("bench_throughput")
+
+# One template per strategy the agent picks, so a run exercises CoT,
+# self-consistency and decomposition in a fixed mix.
+_TEMPLATES = [
+    ("math", "Calculate the total cost if {a} items cost ${b} each and then a {c}% discount is applied."),
+    ("logic", "Who finished third in the race if Ann beat Bob and Cy was {a}th?"),
+    ("common_sense", "A shop has {a} apples and sells {b} of them. How many apples are left?"),
+    ("math", "If a train travels {a} km in {b} hours, what is its average speed in km/h?"),
+]
+
+
+def synthetic_questions(count: int, seed: int = 476) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        domain, template = _TEMPLATES[i % len(_TEMPLATES)]
+        text = template.format(a=rng.randint(2, 99), b=rng.randint(2, 99), c=rng.randint(5, 50))
+        questions.append({"input": text, "domain": domain, "expected_output": "42"})
+    return questions
+
+
+def percentile(values: List[float], q: float) -> float:
+    # Nearest-rank percentile; good enough for a benchmark report.
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class _TimedAgent:
+    # Wraps an agent and records the wall time and call count of every
+    # solve(), whichever driver is calling it.
+    def __init__(self, agent: ReasoningAgent):
+        self._agent = agent
+        self._lock = threading.Lock()
+        self.latencies: List[float] = []
+        self.calls: List[int] = []
+
+    def solve(self, question: str, domain: Optional[str] = None) -> Dict[str, Any]:
+        start = time.perf_counter()
+        result = self._agent.solve(question, domain=domain)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.calls.append(result.get("call_count", 0))
+        return result
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._agent, name)
+
+
+def run_scenario(
+    name: str,
+    api_base: str,
+    questions: List[Dict[str, Any]],
+    workers: int,
+    agent_kwargs: Dict[str, Any],
+) -> Dict[str, Any]:
+    agent = _TimedAgent(ReasoningAgent(api_key="mock", api_base=api_base, model="mock-model", **agent_kwargs))
+    start = time.perf_counter()
+    if name == "process_questions":
+        main_script.process_questions(questions, agent, workers=workers)
+    else:
+        evaluation.evaluate_agent(agent, questions, save_results=False, workers=workers, report_every=0)
+    elapsed = time.perf_counter() - start
+
+    done = len(agent.latencies)
+    report = {
+        "driver": name,
+        "replicas": len(agent.client.backends),
+        "workers": workers,
+        "questions": done,
+        "elapsed_seconds": round(elapsed, 3),
+        "questions_per_second": round(done / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_p50": round(percentile(agent.latencies, 50), 4),
+        "latency_p95": round(percentile(agent.latencies, 95), 4),
+        "latency_p99": round(percentile(agent.latencies, 99), 4),
+        "calls_per_question": round(sum(agent.calls) / max(done, 1), 2),
+        "pool": agent.client.pool_stats(),
+        "backends": agent.client.backend_stats(),
+        "hedging": agent.client.hedge_stats(),
+    }
+    return report
+
+
+def print_report(reports: List[Dict[str, Any]]) -> None:
+    header = f"{'driver':<18} {'replicas':>8} {'workers':>7} {'q/s':>8} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'calls/q':>8} {'hedged':>7}"
+    print(header)
+    print("-" * len(header))
+    for r in reports:
+        hedged = f"{r['hedging']['hedge_rate']:.1%}" if r["hedging"] else "-"
+        print(
+            f"{r['driver']:<18} {r['replicas']:>8} {r['workers']:>7} {r['questions_per_second']:>8.2f} "
+            f"{r['latency_p50']:>8.3f} {r['latency_p95']:>8.3f} {r['latency_p99']:>8.3f} "
+            f"{r['calls_per_question']:>8.2f} {hedged:>7}"
+        )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Measure agent throughput end to end against a local mock server."
+    )
+    parser.add_argument("--questions", type=int, default=40,
+                        help="Number of synthetic questions per scenario (default: 40)")
+    parser.add_argument("--input", type=Path, default=None,
+                        help="Use questions from this JSON/JSONL file instead of synthetic ones")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16],
+                        help="Worker counts to run process_questions with; evaluate_agent uses the largest (default: 1 4 16)")
+    parser.add_argument("--skip-eval", action="store_true",
+                        help="Do not run the evaluation.evaluate_agent scenario")
+    parser.add_argument("--api-base", default=None,
+                        help="Benchmark already running servers (comma-separated) instead of starting mocks")
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1],
+                        help="Numbers of mock server replicas to route across; each is run with every "
+                             "worker count (default: 1)")
+    parser.add_argument("--routing", choices=["least_outstanding", "ewma"], default="least_outstanding",
+                        help="Routing policy across replicas (default: least_outstanding)")
+    parser.add_argument("--pool-size", type=int, default=32)
+    parser.add_argument("--no-stream", action="store_true",
+                        help="Disable streamed early stopping for chain-of-thought")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Run the agent in cascade mode")
+    parser.add_argument("--adaptive-max-tokens", action="store_true",
+                        help="Size max_tokens from observed completion lengths")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Hedge calls slower than --hedge-percentile of their kind")
+    parser.add_argument("--hedge-percentile", type=float, default=0.95)
+    parser.add_argument("--hedge-max-rate", type=float, default=0.1)
+    parser.add_argument("--requests-per-second", type=float, default=None,
+                        help="Token-bucket limit on requests started per second")
+    parser.add_argument("--tokens-per-second", type=float, default=None,
+                        help="Token-bucket limit on prompt + completion tokens per second")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Also write the reports as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the agent's INFO logging")
+    add_behaviour_args(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    if args.input is not None:
+        questions = list(main_script.load_questions(args.input))
+    else:
+        questions = synthetic_questions(args.questions)
+
+    # Every replica count routes across the first N of the same mock servers
+    servers = []
+    if args.api_base is not None:
+        bases = [args.api_base]
+    else:
+        servers = [MockServer(**behaviour_from_args(args)).start() for _ in range(max(args.replicas))]
+        bases = [",".join(s.url for s in servers[:r]) for r in args.replicas]
+
+    agent_kwargs = {"pool_size": args.pool_size, "stream_early_stop": not args.no_stream, "cascade": args.cascade,
+                    "adaptive_max_tokens": args.adaptive_max_tokens, "routing_policy": args.routing,
+                    "hedge": args.hedge, "hedge_percentile": args.hedge_percentile,
+                    "hedge_max_rate": args.hedge_max_rate, "requests_per_second": args.requests_per_second,
+                    "tokens_per_second": args.tokens_per_second}
+    reports = []
+    try:
+        for api_base in bases:
+            for workers in args.workers:
+                reports.append(run_scenario("process_questions", api_base, questions, workers, agent_kwargs))
+            if not args.skip_eval:
+                reports.append(run_scenario("evaluate_agent", api_base, questions, max(args.workers), agent_kwargs))
+    finally:
+        for server in servers:
+            server.stop()
+
+    print_report(reports)
+    for i, server in enumerate(servers, 1):
+        print(f"\nmock server {i}: {server.stats()}")
+    if args.output is not None:
+        with args.output.open("w") as fp:
+            json.dump({"reports": reports, "servers": [s.stats() for s in servers]}, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
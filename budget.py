@@ -0,0 +1,120 @@
+import time
+import threading
+from typing import Dict, Any, Optional
+
+# One lock for every budget, so a call is checked and charged against a
+# question budget and its run budget atomically.
+_lock = threading.RLock()
+
+
+def _smaller(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+
+class Budget:
+    # Call, token and wall-clock limits. A question budget has the run budget
+    # as its parent: every call and token is charged to both, and whichever
+    # has less left is what the caller sees. None means unlimited. The clock
+    # starts at start() (or the first call if start() is never used).
+    def __init__(
+        self,
+        max_calls: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        max_seconds: Optional[float] = None,
+        parent: Optional["Budget"] = None,
+    ):
+        self.max_calls = max_calls
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.parent = parent
+        self.calls = 0
+        self.tokens = 0
+        self.refused = 0
+        self._started = None
+
+    def start(self) -> None:
+        # Also starts any parent that has not started yet
+        with _lock:
+            now = time.monotonic()
+            budget = self
+            while budget is not None:
+                if budget._started is None:
+                    budget._started = now
+                budget = budget.parent
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started if self._started is not None else 0.0
+
+    def remaining_calls(self) -> Optional[int]:
+        with _lock:
+            own = self.max_calls - self.calls if self.max_calls is not None else None
+            return _smaller(own, self.parent.remaining_calls() if self.parent else None)
+
+    def remaining_tokens(self) -> Optional[int]:
+        with _lock:
+            own = self.max_tokens - self.tokens if self.max_tokens is not None else None
+            return _smaller(own, self.parent.remaining_tokens() if self.parent else None)
+
+    def remaining_seconds(self) -> Optional[float]:
+        with _lock:
+            own = self.max_seconds - self.elapsed() if self.max_seconds is not None else None
+            return _smaller(own, self.parent.remaining_seconds() if self.parent else None)
+
+    def exhausted(self) -> bool:
+        return not self._allows(0)
+
+    def _allows(self, estimated_tokens: int) -> bool:
+        calls = self.remaining_calls()
+        tokens = self.remaining_tokens()
+        seconds = self.remaining_seconds()
+        return (
+            (calls is None or calls > 0)
+            and (tokens is None or tokens > estimated_tokens)
+            and (seconds is None or seconds > 0)
+        )
+
+    def take_call(self, estimated_tokens: int = 0) -> bool:
+        # Reserves one call here and in every parent, or refuses without
+        # charging anything.
+        with _lock:
+            self.start()
+            allowed = self._allows(estimated_tokens)
+            budget = self
+            while budget is not None:
+                if allowed:
+                    budget.calls += 1
+                else:
+                    budget.refused += 1
+                budget = budget.parent
+            return allowed
+
+    def charge_tokens(self, tokens: int) -> None:
+        with _lock:
+            budget = self
+            while budget is not None:
+                budget.tokens += tokens
+                budget = budget.parent
+
+    def cap_max_tokens(self, max_tokens: int, prompt_tokens: int = 0) -> int:
+        # Largest completion that still fits in the token budget
+        remaining = self.remaining_tokens()
+        if remaining is None:
+            return max_tokens
+        return max(0, min(max_tokens, remaining - prompt_tokens))
+
+    def stats(self) -> Dict[str, Any]:
+        with _lock:
+            return {
+                "calls": self.calls,
+                "max_calls": self.max_calls,
+                "tokens": self.tokens,
+                "max_tokens": self.max_tokens,
+                "seconds": round(self.elapsed(), 2),
+                "max_seconds": self.max_seconds,
+                "refused_calls": self.refused,
+                "exhausted": self.exhausted(),
+            }
@@ -0,0 +1,198 @@
+import re
+import math
+import logging
+from typing import Dict, Any, Optional, Tuple
+from api_client import APIClient, run_sync, current_budget
+from utils import extract_answer_and_rule, final_answer_emitted, normalize_answer
+
+logger = logging.getLogger(__name__)
+
+# How much an answer can be trusted given the extraction rule that found
+# it: an explicit "total"/"final" line or "answer is B" is a deliberate
+# answer, the last sentence of the text is a guess.
+EXTRACTION_STRENGTH = {
+    "final_line": 0.9,
+    "choice_phrase": 0.85,
+    "choice_line": 0.7,
+    "equation": 0.7,
+    "phrase": 0.5,
+    "sentence": 0.3,
+    "fallback": 0.1,
+    "empty": 0.0,
+}
+
+_NUMBER_RE = re.compile(r"\d")
+_OPTION_RE = re.compile(r"(?:^|\s)\(?[A-E][).]\s", re.MULTILINE)
+_LETTER_ANSWER_RE = re.compile(r"^\(?[A-E]\)?$")
+_FINAL_ANSWER_RE = re.compile(r"final answer\s*(?:is\b|:)\s*(.+?)\s*\.?\s*$", re.IGNORECASE)
+
+
+def _as_number(text: str) -> Optional[float]:
+    try:
+        return float(text.replace(",", "").replace("$", ""))
+    except ValueError:
+        return None
+
+
+def answers_agree(a: str, b: str) -> bool:
+    a, b = normalize_answer(a), normalize_answer(b)
+    if not a or not b:
+        return False
+    if a == b:
+        return True
+    x, y = _as_number(a), _as_number(b)
+    return x is not None and y is not None and math.isclose(x, y, rel_tol=1e-6)
+
+
+def logprob_confidence(raw: Optional[Dict[str, Any]], tail: int = 16) -> Optional[float]:
+    # Geometric mean token probability over the end of the completion, where
+    # the answer is, when the server returned logprobs.
+    try:
+        tokens = raw["choices"][0]["logprobs"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None
+    values = [t["logprob"] for t in tokens[-tail:] if isinstance(t, dict) and "logprob" in t]
+    if not values:
+        return None
+    return math.exp(sum(values) / len(values))
+
+
+def estimate_confidence(
+    question: str,
+    text: str,
+    domain: Optional[str] = None,
+    finish_reason: Optional[str] = None,
+    raw: Optional[Dict[str, Any]] = None,
+) -> Tuple[str, float, Dict[str, Any]]:
+    # Returns the extracted answer, a confidence in [0, 1] and the signals
+    # it was computed from.
+    answer, rule = extract_answer_and_rule(text or "")
+    explicit = bool(text) and final_answer_emitted(text.rstrip() + "\n")
+    if explicit and rule not in ("final_line", "choice_phrase"):
+        # The draft prompt asks for a "Final answer: ..." line; take the
+        # answer from it rather than from a weaker rule
+        stated = _FINAL_ANSWER_RE.search(text.rstrip().rsplit("\n", 1)[-1])
+        if stated:
+            answer = stated.group(1)
+    confidence = max(EXTRACTION_STRENGTH.get(rule, 0.0), 0.9 if explicit else 0.0)
+    signals: Dict[str, Any] = {"rule": rule, "explicit": explicit}
+
+    # Answer-format checks: a truncated completion never finished its
+    # reasoning, and an answer of the wrong shape was probably mis-extracted.
+    problems = []
+    if finish_reason == "length":
+        problems.append("truncated")
+        confidence = min(confidence, 0.2)
+    if len(answer) > 80:
+        problems.append("long_answer")
+        confidence *= 0.5
+    if domain == "math" and not _NUMBER_RE.search(answer):
+        problems.append("not_numeric")
+        confidence *= 0.5
+    if len(_OPTION_RE.findall(question)) >= 2 and not _LETTER_ANSWER_RE.match(answer.strip()):
+        problems.append("not_an_option")
+        confidence *= 0.5
+    signals["format_problems"] = problems
+
+    token_confidence = logprob_confidence(raw)
+    if token_confidence is not None:
+        signals["logprob_confidence"] = round(token_confidence, 4)
+        confidence = min(confidence, token_confidence)
+
+    return answer, round(confidence, 4), signals
+
+
+class Cascade:
+    # One short, deterministic chain-of-thought draft whose answer is kept
+    # when it looks trustworthy. Borderline drafts get a second, sampled
+    # draft and are kept if the two agree; everything else is reported as
+    # not accepted so the caller can escalate to a stronger technique.
+    SYSTEM_PROMPT = "You are a helpful assistant."
+    PROMPT = (
+        "{question}\n\nThink step by step, briefly. "
+        "End with a line of the form \"Final answer: <answer>\"."
+    )
+    TEMPERATURE = 0.0
+    VERIFY_TEMPERATURE = 0.7
+    MAX_TOKENS = 512
+
+    def __init__(
+        self,
+        client: APIClient,
+        accept: float = 0.8,
+        verify: float = 0.4,
+        early_stop: bool = True,
+        logprobs: bool = False,
+    ):
+        self.client = client
+        # Drafts at or above `accept` are kept outright; drafts between
+        # `verify` and `accept` need a second, agreeing draft.
+        self.accept = accept
+        self.verify = verify
+        self.early_stop = early_stop
+        # Logprobs need a non-streamed request, so they turn early stopping off
+        self.logprobs = logprobs
+
+    def solve(self, question: str, domain: Optional[str] = None) -> Dict[str, Any]:
+        return run_sync(self.asolve(question, domain))
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            "system": self.SYSTEM_PROMPT,
+            "prompt": self.PROMPT,
+            "temperature": [self.TEMPERATURE, self.VERIFY_TEMPERATURE],
+            "max_tokens": self.MAX_TOKENS,
+            "accept": self.accept,
+            "verify": self.verify,
+            "early_stop": self.early_stop,
+            "logprobs": self.logprobs,
+        }
+
+    async def _draft(self, question: str, domain: Optional[str], temperature: float) -> Optional[Dict[str, Any]]:
+        result = await self.client.acall(
+            self.PROMPT.format(question=question), system=self.SYSTEM_PROMPT,
+            temperature=temperature, max_tokens=self.MAX_TOKENS, logprobs=self.logprobs,
+            stop_when=final_answer_emitted if self.early_stop and not self.logprobs else None,
+            size_as="cascade"
+        )
+        if not result["ok"]:
+            return None
+        answer, confidence, signals = estimate_confidence(
+            question, result["text"], domain, result.get("finish_reason"), result.get("raw")
+        )
+        return {"answer": answer, "confidence": confidence, "signals": signals, "text": result["text"]}
+
+    async def asolve(self, question: str, domain: Optional[str] = None) -> Dict[str, Any]:
+        first = await self._draft(question, domain, self.TEMPERATURE)
+        if first is None:
+            return {"answer": "", "full_response": "", "accepted": False, "confidence": 0.0, "drafts": 0}
+
+        confidence = first["confidence"]
+        signals = {"first": first["signals"]}
+        drafts = 1
+        accepted = confidence >= self.accept
+
+        budget = current_budget()
+        calls_left = budget.remaining_calls() if budget is not None else None
+        if not accepted and confidence >= self.verify and (calls_left is None or calls_left > 0):
+            second = await self._draft(question, domain, self.VERIFY_TEMPERATURE)
+            if second is not None:
+                drafts += 1
+                signals["second"] = second["signals"]
+                signals["agree"] = answers_agree(first["answer"], second["answer"])
+                if signals["agree"] and second["confidence"] >= self.verify:
+                    accepted = True
+                    confidence = max(confidence, second["confidence"], self.accept)
+
+        logger.info(
+            f"Cascade draft {'accepted' if accepted else 'escalated'} "
+            f"(confidence {confidence:.2f}, {drafts} draft(s))"
+        )
+        return {
+            "answer": first["answer"],
+            "full_response": first["text"],
+            "accepted": accepted,
+            "confidence": confidence,
+            "signals": signals,
+            "drafts": drafts,
+        }
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+
+# Single entry point for running, evaluating, benchmarking and probing the
+# agent. Only argparse is imported up front; each subcommand imports what it
+# needs, so --help and --dry-run do not pay for the agent, asyncio or the
+# HTTP stack.
+
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+ENV_PREFIX = "REASONING_AGENT_"
+
+DEFAULT_API_BASE = "http://10.4.58.53:41701/v1"
+DEFAULT_API_KEY = "cse476"
+DEFAULT_MODEL = "bens_model"
+DEFAULT_MAX_CALLS_PER_QUESTION = 18
+
+RUN_INPUT_PATH = Path("cse_476_final_project_test_data.json")
+RUN_OUTPUT_PATH = Path("cse_476_final_project_answers.json")
+RUN_LOG_PATH = Path("agent_execution_log.json")
+RUN_JOURNAL_PATH = Path("agent_execution_journal.jsonl")
+DEV_DATA_PATH = Path("development_data.json")
+RESULTS_PATH = Path("evaluation_results.json")
+MAX_TOKENS_STATS_PATH = Path("max_tokens_stats.json")
+
+
+def env(name: str, default: Any = None, type=str) -> Any:
+    value = os.environ.get(ENV_PREFIX + name)
+    if value is None or value == "":
+        return default
+    if type is bool:
+        return value.lower() in ("1", "true", "yes", "on")
+    return type(value)
+
+
+def env_settings() -> Dict[str, Any]:
+    # Endpoint settings from the environment, for scripts without flags
+    return {
+        "api_key": env("API_KEY", DEFAULT_API_KEY),
+        "api_base": env("API_BASE", DEFAULT_API_BASE),
+        "model": env("MODEL", DEFAULT_MODEL),
+        "max_calls_per_question": env("MAX_CALLS_PER_QUESTION", DEFAULT_MAX_CALLS_PER_QUESTION, int),
+    }
+
+
+def _shard(value: str) -> Tuple[int, int]:
+    # "K/N": the K-th of N contiguous slices of the input, counting from 1
+    k, _, n = value.partition("/")
+    try:
+        k, n = int(k), int(n)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected K/N, got {value!r}")
+    if not 1 <= k <= n:
+        raise argparse.ArgumentTypeError(f"shard {value!r} needs 1 <= K <= N")
+    return k, n
+
+
+def _add(parser: argparse.ArgumentParser, flag: str, name: str, default: Any, help: str, type=str, **kwargs) -> None:
+    # An option whose default can come from REASONING_AGENT_<name>
+    if type is bool:
+        parser.add_argument(flag, action="store_true", default=env(name, default, bool),
+                            help=f"{help} (env: {ENV_PREFIX}{name})")
+        return
+    parser.add_argument(flag, type=type, default=env(name, default, type), **kwargs,
+                        help=f"{help} (env: {ENV_PREFIX}{name}, default: {default})")
+
+
+def _endpoint_args(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("endpoint")
+    _add(group, "--api-base", "API_BASE", DEFAULT_API_BASE, "OpenAI-compatible base URL; a comma-separated list routes across replicas")
+    _add(group, "--api-key", "API_KEY", DEFAULT_API_KEY, "API key")
+    _add(group, "--model", "MODEL", DEFAULT_MODEL, "Model name")
+    group.add_argument("--transport", choices=["asyncio", "requests"], default=env("TRANSPORT"),
+                       help="HTTP client: the built-in asyncio pool, or requests in a thread pool "
+                            "(default: asyncio, or requests when HTTP(S)_PROXY applies; "
+                            f"env: {ENV_PREFIX}TRANSPORT)")
+
+
+def _agent_args(parser: argparse.ArgumentParser) -> None:
+    _endpoint_args(parser)
+    group = parser.add_argument_group("agent")
+    _add(group, "--workers", "WORKERS", 1, "Questions solved concurrently", int)
+    _add(group, "--pool-size", "POOL_SIZE", 32, "HTTP connections kept open", int)
+    _add(group, "--max-calls-per-question", "MAX_CALLS_PER_QUESTION", DEFAULT_MAX_CALLS_PER_QUESTION,
+         "API call limit per question", int)
+    group.add_argument("--strategy", choices=["cot", "self_consistency", "decomposition"],
+                       default=env("STRATEGY"),
+                       help=f"Use this technique for every question (env: {ENV_PREFIX}STRATEGY)")
+    group.add_argument("--routing", choices=["least_outstanding", "ewma"],
+                       default=env("ROUTING", "least_outstanding"),
+                       help="How requests are spread over several --api-base replicas "
+                            f"(env: {ENV_PREFIX}ROUTING, default: least_outstanding)")
+    _add(group, "--cascade", "CASCADE", False,
+         "Try a short chain-of-thought draft first; escalate only uncertain questions", bool)
+    _add(group, "--adaptive-max-tokens", "ADAPTIVE_MAX_TOKENS", False,
+         f"Size max_tokens from observed completion lengths (kept in {MAX_TOKENS_STATS_PATH})", bool)
+    _add(group, "--hedge", "HEDGE", False,
+         "Send a duplicate of calls slower than --hedge-percentile; the first answer wins", bool)
+    _add(group, "--hedge-percentile", "HEDGE_PERCENTILE", 0.95,
+         "Latency percentile, per kind of call, after which a call is hedged", float)
+    _add(group, "--hedge-max-rate", "HEDGE_MAX_RATE", 0.1, "Largest fraction of calls that may be hedged", float)
+    _add(group, "--requests-per-second", "REQUESTS_PER_SECOND", None,
+         "Token-bucket limit on requests started per second", float)
+    _add(group, "--tokens-per-second", "TOKENS_PER_SECOND", None,
+         "Token-bucket limit on prompt + completion tokens per second", float)
+    _add(group, "--cache", "CACHE", None, "SQLite file for caching model responses", metavar="PATH")
+    _add(group, "--cache-all", "CACHE_ALL", False, "Also cache sampled (temperature > 0) responses", bool)
+    group.add_argument("--clear-cache", action="store_true", help="Empty the response cache before starting")
+    _add(group, "--max-calls", "MAX_CALLS", None, "API call budget for the whole run", int)
+    _add(group, "--max-tokens", "MAX_TOKENS", None, "Prompt + completion token budget for the whole run", int)
+    _add(group, "--max-seconds", "MAX_SECONDS", None, "Wall-clock budget for the whole run", float)
+    _add(group, "--metrics", "METRICS", None, "Also write API metrics in Prometheus text format to PATH",
+         Path, metavar="PATH")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Check the input and print the resolved configuration without calling the API")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description="Run, evaluate, benchmark or probe the reasoning agent."
+    )
+    _add(parser, "--log-level", "LOG_LEVEL", "INFO", "Logging level",
+         choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    sub = parser.add_subparsers(dest="command", required=True, metavar="COMMAND")
+
+    run = sub.add_parser("run", help="Answer a question file (replaces main_script.py and generate_answers.py)")
+    _agent_args(run)
+    files = run.add_argument_group("files")
+    _add(files, "--input", "INPUT", RUN_INPUT_PATH, "Questions (JSON array or JSONL)", Path)
+    _add(files, "--output", "OUTPUT", RUN_OUTPUT_PATH, "Where to write the answers", Path)
+    _add(files, "--log", "LOG", RUN_LOG_PATH, "Where to write the execution log", Path)
+    _add(files, "--journal", "JOURNAL", RUN_JOURNAL_PATH, "Append-only journal of finished questions", Path)
+    run.add_argument("--answers-only", action="store_true",
+                     help="Write only the answers file, not the execution log")
+    run.add_argument("--resume", action="store_true", help="Skip questions already answered in the journal")
+    _add(run, "--shard", "SHARD", None, "Answer only the K-th of N equal slices of the input, e.g. 2/4; "
+         "give each shard its own --output, --log and --journal", _shard, metavar="K/N")
+    run.add_argument("--dedupe", action="store_true",
+                     help="Solve duplicate and near-duplicate questions once and reuse the answer")
+    run.add_argument("--dedupe-threshold", type=float, default=0.8,
+                     help="Shingle similarity for near-duplicates; 1.0 merges exact duplicates only (default: 0.8)")
+    run.set_defaults(handler=cmd_run)
+
+    ev = sub.add_parser("eval", help="Score the agent on development data (replaces evaluation.py)")
+    _agent_args(ev)
+    _add(ev, "--dev-data", "DEV_DATA", DEV_DATA_PATH, "Development data with expected outputs", Path)
+    _add(ev, "--results", "RESULTS", RESULTS_PATH, "Where to read and write per-sample results", Path)
+    _add(ev, "--num-samples", "NUM_SAMPLES", 50, "Evaluate only the first N samples; 0 evaluates all", int)
+    ev.add_argument("--report-every", type=int, default=10,
+                    help="Log running accuracy every N finished samples; 0 disables (default: 10)")
+    ev.add_argument("--full", action="store_true",
+                    help="Re-solve every sample instead of reusing unchanged results")
+    ev.set_defaults(handler=cmd_eval)
+
+    bench = sub.add_parser("bench", add_help=False,
+                           help="Throughput benchmark against the mock server (bench_throughput.py options)")
+    bench.add_argument("bench_args", nargs=argparse.REMAINDER)
+    bench.set_defaults(handler=cmd_bench)
+
+    probe = sub.add_parser("probe", help="Check that the endpoint answers and report its latency and features")
+    _endpoint_args(probe)
+    probe.add_argument("--requests", type=int, default=3, help="Number of timed requests (default: 3)")
+    probe.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds (default: 30)")
+    probe.set_defaults(handler=cmd_probe)
+    return parser
+
+
+def _configure_logging(level: str) -> None:
+    import logging
+    logging.basicConfig(level=getattr(logging, level), format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def _print_config(args: argparse.Namespace) -> None:
+    config = {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items() if k != "handler"}
+    if config.get("api_key"):
+        config["api_key"] = "***"
+    print(json.dumps(config, indent=2, sort_keys=True))
+
+
+def _dry_run(args: argparse.Namespace, path: Path) -> int:
+    # Streams the input once to count records and domains; nothing heavier
+    # than the loader is imported.
+    from loader import iter_questions
+    _print_config(args)
+    if not path.exists():
+        print(f"input not found: {path}", file=sys.stderr)
+        return 1
+    domains: Dict[str, int] = {}
+    for record in iter_questions(path):
+        domain = record.get("domain") or "unknown"
+        domains[domain] = domains.get(domain, 0) + 1
+    print(f"{sum(domains.values())} questions in {path}: "
+          + ", ".join(f"{d}={n}" for d, n in sorted(domains.items())))
+    return 0
+
+
+def build_agent(args: argparse.Namespace):
+    from agent import ReasoningAgent
+    agent = ReasoningAgent(
+        api_key=args.api_key,
+        api_base=args.api_base,
+        model=args.model,
+        transport=args.transport,
+        max_calls_per_question=args.max_calls_per_question,
+        pool_size=args.pool_size,
+        requests_per_second=args.requests_per_second,
+        tokens_per_second=args.tokens_per_second,
+        cache_path=args.cache,
+        cache_all_temperatures=args.cache_all,
+        max_calls_per_run=args.max_calls,
+        max_tokens_per_run=args.max_tokens,
+        max_seconds_per_run=args.max_seconds,
+        strategy=args.strategy,
+        cascade=args.cascade,
+        adaptive_max_tokens=args.adaptive_max_tokens,
+        max_tokens_stats_path=str(MAX_TOKENS_STATS_PATH),
+        routing_policy=args.routing,
+        hedge=args.hedge,
+        hedge_percentile=args.hedge_percentile,
+        hedge_max_rate=args.hedge_max_rate,
+    )
+    if args.clear_cache and agent.client.cache is not None:
+        agent.client.cache.clear()
+    return agent
+
+
+def cmd_run(args: argparse.Namespace) -> int:
+    if args.dry_run:
+        return _dry_run(args, args.input)
+
+    import logging
+    import main_script
+    from dedupe import QuestionDeduper
+    from journal import Journal
+    logger = logging.getLogger("cli")
+
+    if not args.input.exists():
+        logger.error(f"Input file not found: {args.input}")
+        return 1
+
+    # A shard seeks straight to its slice through the byte-offset index
+    first_id = 1
+    questions = main_script.load_questions(args.input)
+    if args.shard is not None:
+        from loader import QuestionIndex
+        k, n = args.shard
+        index = QuestionIndex.load_or_build(args.input)
+        start, stop = len(index) * (k - 1) // n, len(index) * k // n
+        logger.info(f"Shard {k}/{n}: questions {start + 1}-{stop} of {len(index)}")
+        first_id = start + 1
+        questions = index.iter_range(start, stop)
+
+    # Questions are counted as they stream past, so validating the answers
+    # needs no second pass over the input
+    read = 0
+
+    def counted():
+        nonlocal read
+        for question in questions:
+            read += 1
+            yield question
+
+    logger.info("Initializing reasoning agent...")
+    agent = build_agent(args)
+    answers, execution_log = main_script.process_questions(
+        counted(), agent, workers=args.workers,
+        journal=Journal(args.journal), resume=args.resume,
+        deduper=QuestionDeduper(args.dedupe_threshold) if args.dedupe else None,
+        first_id=first_id
+    )
+
+    main_script.save_answers(answers, args.output)
+    if not args.answers_only:
+        main_script.save_execution_log(execution_log, args.log)
+    if args.metrics is not None:
+        main_script.save_metrics(agent, args.metrics)
+    agent.save_max_tokens_stats()
+
+    main_script.validate_answers(range(read), answers)
+    logger.info(f"Successfully generated {len(answers)} answers")
+    logger.info(f"Answers saved to: {args.output}")
+    return 0
+
+
+def cmd_eval(args: argparse.Namespace) -> int:
+    if args.dry_run:
+        return _dry_run(args, args.dev_data)
+
+    import logging
+    import evaluation
+    logger = logging.getLogger("cli")
+
+    if not args.dev_data.exists():
+        logger.error(f"Development data not found: {args.dev_data}")
+        return 1
+
+    agent = build_agent(args)
+    evaluation.evaluate_agent(
+        agent, evaluation.load_dev_data(args.dev_data), num_samples=args.num_samples or None,
+        workers=args.workers, report_every=args.report_every,
+        previous=evaluation.load_previous_results(args.results),
+        results_path=args.results, reuse=not args.full
+    )
+    if args.metrics is not None:
+        import main_script
+        main_script.save_metrics(agent, args.metrics)
+    agent.save_max_tokens_stats()
+    return 0
+
+
+def cmd_bench(args: argparse.Namespace) -> int:
+    import bench_throughput
+    bench_throughput.main(args.bench_args)
+    return 0
+
+
+def cmd_probe(args: argparse.Namespace) -> int:
+    # Each replica in --api-base is probed on its own
+    from routing import parse_api_bases
+    bases = parse_api_bases(args.api_base)
+    ok = True
+    for base in bases:
+        if len(bases) > 1:
+            print(f"== {base}")
+        ok = _probe_backend(args, base) and ok
+    return 0 if ok else 1
+
+
+def _probe_backend(args: argparse.Namespace, base: str) -> bool:
+    # A models listing, a few timed one-token requests and an "n" check
+    import time
+    import urllib.request
+    from api_client import APIClient
+
+    ok = True
+    try:
+        req = urllib.request.Request(f"{base}/models",
+                                     headers={"Authorization": f"Bearer {args.api_key}"})
+        with urllib.request.urlopen(req, timeout=args.timeout) as resp:
+            models = [m.get("id") for m in json.load(resp).get("data", [])]
+        print(f"models: {', '.join(models) or '(none listed)'}")
+    except Exception as e:
+        print(f"models: unavailable ({e})")
+
+    client = APIClient(args.api_key, base, args.model, max_retries=1, transport=args.transport, pool_size=2)
+    latencies = []
+    for i in range(max(1, args.requests)):
+        start = time.perf_counter()
+        result = client.call("Reply with the word OK.", max_tokens=8, timeout=args.timeout, use_cache=False)
+        elapsed = time.perf_counter() - start
+        if result["ok"]:
+            latencies.append(elapsed)
+            print(f"request {i + 1}: {elapsed * 1000:.0f} ms  {result['text'].strip()[:40]!r}")
+        else:
+            ok = False
+            print(f"request {i + 1}: failed with status {result['status']}: {result['error']}")
+    if latencies:
+        latencies.sort()
+        print(f"latency: min {latencies[0] * 1000:.0f} ms, median {latencies[len(latencies) // 2] * 1000:.0f} ms")
+        client.call("Reply with the word OK.", max_tokens=8, n=2, timeout=args.timeout, use_cache=False)
+        print(f"n > 1: {({True: 'supported', False: 'not supported'}).get(client.supports_n, 'unknown')}")
+    print(f"connections: {client.pool_stats()}")
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    # bench passes everything it does not know on to bench_throughput.py
+    args, extra = parser.parse_known_args(argv)
+    if args.command == "bench":
+        args.bench_args = extra + args.bench_args
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    if args.command != "bench":
+        _configure_logging(args.log_level)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
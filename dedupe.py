@@ -0,0 +1,132 @@
+import re
+import zlib
+import random
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_FINAL_PUNCT_RE = re.compile(r"(?<=\w)[?.]+(?=\s|$)")
+_OPERATOR_SPACING_RE = re.compile(r"\s*([-+*/=<>^()])\s*")
+_SPACES_RE = re.compile(r"\s+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+# Words whose presence or absence does not change what is being asked.
+# Near-duplicates may only differ by these: shingle similarity alone would
+# merge "who finished first" with "who finished last".
+_FILLER_WORDS = frozenset({
+    "a", "an", "the", "it", "its", "this", "that", "there", "then", "so",
+    "please", "kindly", "just", "now", "here", "of", "in", "on", "at", "to",
+    "is", "are", "was", "do", "does", "can", "you", "me", "us", "tell",
+    "and", "also", "exactly", "question", "q",
+})
+
+
+def normalize_question(text: str) -> str:
+    # Lowercase, collapse whitespace and drop spacing around operators, so
+    # "What is 2+2?" and "what is 2 + 2" match. Only a "?" or "." ending a
+    # sentence after a word is dropped; signs, "!" and other operators
+    # change the question ("-5 + 3" vs "5 + 3", "5!" vs "5.").
+    text = _SPACES_RE.sub(" ", text.lower()).strip()
+    text = _FINAL_PUNCT_RE.sub("", text)
+    text = _OPERATOR_SPACING_RE.sub(r"\1", text)
+    return text.strip()
+
+
+def _shingles(text: str, size: int) -> set:
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class QuestionDeduper:
+    # Assigns each question either to an earlier, equivalent question (its
+    # cluster representative) or makes it a new representative. Exact
+    # matches use the normalised text; near-duplicates are found with
+    # MinHash/LSH over character shingles and confirmed with the exact
+    # Jaccard similarity. Questions whose numbers differ, that come from
+    # different domains, or that differ by anything but filler words are
+    # never merged.
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 5,
+        seed: int = 476,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        # XOR with a random mask stands in for a hash permutation; much
+        # cheaper in pure Python than (a * h + b) mod p and good enough here.
+        self._masks = [rng.getrandbits(32) for _ in range(num_perm)]
+        self._exact: Dict[Tuple[Optional[str], str], int] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = defaultdict(list)
+        self._reps: Dict[int, Tuple[set, Tuple[str, ...], Optional[str], frozenset]] = {}
+        # member question id -> (representative id, similarity)
+        self.mapping: Dict[int, Tuple[int, float]] = {}
+
+    def _signature(self, shingles: set) -> List[int]:
+        hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles]
+        return [min([h ^ mask for h in hashes]) for mask in self._masks]
+
+    def assign(self, idx: int, text: str, domain: Optional[str] = None) -> Optional[Tuple[int, float]]:
+        # Returns (representative id, similarity) for a duplicate, else None
+        norm = normalize_question(text)
+        key = (domain, norm)
+        rep = self._exact.get(key)
+        if rep is not None:
+            self.mapping[idx] = (rep, 1.0)
+            return rep, 1.0
+
+        shingles = numbers = signature = None
+        if self.threshold < 1.0 and norm:
+            shingles = _shingles(norm, self.shingle_size)
+            numbers = tuple(_NUMBER_RE.findall(norm))
+            words = frozenset(norm.split())
+            signature = self._signature(shingles)
+            candidates = set()
+            for band in range(self.bands):
+                chunk = tuple(signature[band * self.rows:(band + 1) * self.rows])
+                candidates.update(self._buckets.get((band, chunk), ()))
+
+            best, best_sim = None, 0.0
+            for cand in sorted(candidates):
+                cand_shingles, cand_numbers, cand_domain, cand_words = self._reps[cand]
+                if cand_domain != domain or cand_numbers != numbers:
+                    continue
+                if not (words ^ cand_words) <= _FILLER_WORDS:
+                    continue
+                sim = len(shingles & cand_shingles) / len(shingles | cand_shingles)
+                if sim > best_sim:
+                    best, best_sim = cand, sim
+            if best is not None and best_sim >= self.threshold:
+                self._exact[key] = best
+                self.mapping[idx] = (best, best_sim)
+                return best, best_sim
+
+        self._exact[key] = idx
+        if signature is not None:
+            self._reps[idx] = (shingles, numbers, domain, words)
+            for band in range(self.bands):
+                chunk = tuple(signature[band * self.rows:(band + 1) * self.rows])
+                self._buckets[(band, chunk)].append(idx)
+        return None
+
+    def clusters(self) -> Dict[int, List[int]]:
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for member, (rep, _) in sorted(self.mapping.items()):
+            groups[rep].append(member)
+        return dict(groups)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "duplicates": len(self.mapping),
+            "exact_duplicates": sum(1 for _, sim in self.mapping.values() if sim == 1.0),
+            "clusters": len(self.clusters()),
+        }
@@ -4,31 +4,24 @@
 import json
 import logging
 from pathlib import Path
-from typing import List, Dict, Any
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 from agent import ReasoningAgent
+from journal import question_hash
+from loader import iter_questions
 from utils import normalize_answer, extract_number
 import time
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-DEV_DATA_PATH = Path("development_data.json")
+RESULTS_PATH = Path("evaluation_results.json")
 
 
-def load_dev_data(path: Path) -> List[Dict[str, Any]]:
+def load_dev_data(path: Path) -> Iterator[Dict[str, Any]]:
 
-    logger.info(f"Loading development data from {path}")
-    with path.open("r") as fp:
-        data = json.load(fp)
-    
-    if not isinstance(data, list):
-        raise ValueError("Dev data must be a list")
-    
-    logger.info(f"Loaded {len(data)} development examples")
-    return data
+    logger.info(f"Streaming development data from {path}")
+    return iter_questions(path)
 
 
 def is_correct(predicted: str, expected: str, question: str = "") -> bool:
@@ -76,10 +69,46 @@ def is_correct(predicted: str, expected: str, question: str = "") -> bool:
     return False
 
 
+def load_previous_results(path: Path) -> Dict[str, Dict[str, Any]]:
+    # Earlier per-sample results keyed by question hash, for samples that
+    # carry a configuration fingerprint and did not fail.
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r") as fp:
+            data = json.load(fp)
+    except ValueError:
+        logger.warning(f"Ignoring unreadable previous results in {path}")
+        return {}
+    previous = {}
+    for r in data.get("results", []):
+        if r.get("fingerprint") and "error" not in r:
+            previous[question_hash(r.get("question", ""))] = r
+    logger.info(f"Loaded {len(previous)} previous results from {path}")
+    return previous
+
+
+def reuse_result(
+    previous: Dict[str, Dict[str, Any]],
+    sample: Dict[str, Any],
+    idx: int,
+    fingerprint: str
+) -> Optional[Dict[str, Any]]:
+    question = sample.get("input", "")
+    expected = sample.get("expected_output", "")
+    prev = previous.get(question_hash(question))
+    if (prev is None or prev.get("fingerprint") != fingerprint
+            or prev.get("expected") != expected or prev.get("domain") != sample.get("domain", None)):
+        return None
+    # Re-score, since is_correct may have changed even if the agent did not
+    return dict(prev, idx=idx, reused=True, correct=is_correct(prev.get("predicted", ""), expected, question))
+
+
 def evaluate_sample(
     agent: ReasoningAgent,
     sample: Dict[str, Any],
-    idx: int
+    idx: int,
+    fingerprint: Optional[str] = None
 ) -> Dict[str, Any]:
     question = sample.get("input", "")
     expected = sample.get("expected_output", "")
@@ -115,7 +144,9 @@ def evaluate_sample(
             "correct": correct,
             "technique": result["technique_used"],
             "api_calls": result["call_count"],
-            "time_seconds": round(elapsed, 2)
+            "time_seconds": round(elapsed, 2),
+            "fingerprint": fingerprint,
+            "escalated": result["cascade"]["escalated"] if "cascade" in result else None
         }
         
     except Exception as e:
@@ -132,81 +163,155 @@ def evaluate_sample(
         }
 
 
+class RunningMetrics:
+    # Accuracy, call and time totals and per-domain stats, updated as each
+    # result arrives so progress can be reported before the run finishes.
+    def __init__(self):
+        self.total = 0
+        self.correct = 0
+        self.total_calls = 0
+        self.total_time = 0.0
+        self.errors = 0
+        self.reused = 0
+        self.cascaded = 0
+        self.escalated = 0
+        self.domain_stats: Dict[str, Dict[str, Any]] = {}
+        self.started = time.time()
+
+    def add(self, result: Dict[str, Any]) -> None:
+        self.total += 1
+        self.correct += bool(result.get("correct", False))
+        self.total_calls += result.get("api_calls", 0)
+        self.total_time += result.get("time_seconds", 0)
+        self.errors += "error" in result
+        self.reused += bool(result.get("reused", False))
+        if result.get("escalated") is not None:
+            self.cascaded += 1
+            self.escalated += result["escalated"]
+        domain = result.get("domain", "unknown")
+        stats = self.domain_stats.setdefault(domain, {"total": 0, "correct": 0, "accuracy": 0.0})
+        stats["total"] += 1
+        stats["correct"] += bool(result.get("correct", False))
+        stats["accuracy"] = stats["correct"] / stats["total"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        total = self.total
+        wall_time = time.time() - self.started
+        return {
+            "total_samples": total,
+            "correct": self.correct,
+            "accuracy": round(self.correct / total, 4) if total > 0 else 0.0,
+            "total_api_calls": self.total_calls,
+            "avg_api_calls": round(self.total_calls / total, 2) if total > 0 else 0.0,
+            "total_time_seconds": round(self.total_time, 2),
+            "avg_time_seconds": round(self.total_time / total, 2) if total > 0 else 0.0,
+            "wall_time_seconds": round(wall_time, 2),
+            "samples_per_second": round(total / wall_time, 3) if wall_time > 0 else 0.0,
+            "errors": self.errors,
+            "reused_samples": self.reused,
+            "escalation_rate": round(self.escalated / self.cascaded, 4) if self.cascaded else None,
+            "domain_stats": {d: dict(st) for d, st in self.domain_stats.items()}
+        }
+
+    def log_progress(self, expected: Optional[int] = None) -> None:
+        snap = self.snapshot()
+        domains = ", ".join(
+            f"{d}: {st['accuracy']:.0%} ({st['correct']}/{st['total']})"
+            for d, st in sorted(snap["domain_stats"].items())
+        )
+        logger.info(
+            f"[progress] {snap['total_samples']}/{expected or '?'} samples, "
+            f"accuracy {snap['accuracy']:.2%}, avg calls {snap['avg_api_calls']:.2f}, "
+            f"{snap['samples_per_second']:.2f} samples/s | {domains}"
+        )
+
+
 def evaluate_agent(
     agent: ReasoningAgent,
-    dev_data: List[Dict[str, Any]],
+    dev_data: Iterable[Dict[str, Any]],
     num_samples: int = None,
-    save_results: bool = True
+    save_results: bool = True,
+    workers: int = 1,
+    report_every: int = 10,
+    previous: Optional[Dict[str, Dict[str, Any]]] = None,
+    results_path: Path = RESULTS_PATH,
+    reuse: bool = True
 ) -> Dict[str, Any]:
+    # previous holds earlier results (load_previous_results); with reuse,
+    # unchanged samples keep theirs. Either way the saved file keeps earlier
+    # results for questions this run did not evaluate.
 
+    expected = len(dev_data) if hasattr(dev_data, "__len__") else None
     if num_samples:
-        dev_data = dev_data[:num_samples]
+        expected = min(expected, num_samples) if expected is not None else num_samples
+        dev_data = islice(dev_data, num_samples)
     
     results = []
-    
-    for idx, sample in enumerate(dev_data, start=1):
-        result = evaluate_sample(agent, sample, idx)
+    running = RunningMetrics()
+
+    def record(result: Dict[str, Any]) -> None:
         results.append(result)
-        
-        # Small delay
-        time.sleep(0.3)
-    
-    # Compute metrics
-    total = len(results)
-    correct = sum(1 for r in results if r.get("correct", False))
-    accuracy = correct / total if total > 0 else 0.0
-    
-    total_calls = sum(r.get("api_calls", 0) for r in results)
-    avg_calls = total_calls / total if total > 0 else 0.0
-    
-    total_time = sum(r.get("time_seconds", 0) for r in results)
-    avg_time = total_time / total if total > 0 else 0.0
-    
-    # Group by domain
-    domain_stats = {}
-    for r in results:
-        domain = r.get("domain", "unknown")
-        if domain not in domain_stats:
-            domain_stats[domain] = {"total": 0, "correct": 0}
-        domain_stats[domain]["total"] += 1
-        if r.get("correct", False):
-            domain_stats[domain]["correct"] += 1
-    
-    # Calculate per-domain accuracy
-    for domain in domain_stats:
-        stats = domain_stats[domain]
-        stats["accuracy"] = stats["correct"] / stats["total"] if stats["total"] > 0 else 0.0
-    
-    metrics = {
-        "total_samples": total,
-        "correct": correct,
-        "accuracy": round(accuracy, 4),
-        "total_api_calls": total_calls,
-        "avg_api_calls": round(avg_calls, 2),
-        "total_time_seconds": round(total_time, 2),
-        "avg_time_seconds": round(avg_time, 2),
-        "domain_stats": domain_stats
-    }
+        running.add(result)
+        if report_every and running.total % report_every == 0:
+            running.log_progress(expected)
+
+    # Samples are solved concurrently and scored as they finish; at most
+    # 2 * workers are in flight so the dev data is still streamed.
+    workers = max(1, workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for idx, sample in enumerate(dev_data, start=1):
+            # Samples whose configuration fingerprint is unchanged since the
+            # previous run keep their earlier result instead of being solved
+            fingerprint = agent.config_fingerprint(sample.get("input", ""), sample.get("domain", None))
+            reused = reuse_result(previous, sample, idx, fingerprint) if previous and reuse else None
+            if reused is not None:
+                record(reused)
+                continue
+            pending.add(pool.submit(evaluate_sample, agent, sample, idx, fingerprint))
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record(future.result())
+        for future in as_completed(pending):
+            record(future.result())
+
+    results.sort(key=lambda r: r["idx"])
+    metrics = running.snapshot()
+    metrics["workers"] = workers
+    total = metrics["total_samples"]
+    correct = metrics["correct"]
+    domain_stats = metrics["domain_stats"]
     
     logger.info(f"\n{'='*60}")
     logger.info("EVALUATION RESULTS")
     logger.info(f"{'='*60}")
     logger.info(f"Total samples: {total}")
     logger.info(f"Correct: {correct}")
-    logger.info(f"Accuracy: {accuracy:.2%}")
-    logger.info(f"Avg API calls: {avg_calls:.2f}")
-    logger.info(f"Avg time: {avg_time:.2f}s")
+    logger.info(f"Accuracy: {metrics['accuracy']:.2%}")
+    logger.info(f"Avg API calls: {metrics['avg_api_calls']:.2f}")
+    logger.info(f"Avg time: {metrics['avg_time_seconds']:.2f}s")
+    logger.info(f"Wall time: {metrics['wall_time_seconds']:.2f}s with {workers} worker(s)")
+    if metrics["escalation_rate"] is not None:
+        logger.info(f"Cascade escalation rate: {metrics['escalation_rate']:.2%}")
+    if metrics["reused_samples"]:
+        logger.info(f"Reused {metrics['reused_samples']}/{total} results with an unchanged configuration")
     logger.info(f"\nPer-domain accuracy:")
     for domain, stats in sorted(domain_stats.items()):
         logger.info(f"  {domain}: {stats['accuracy']:.2%} ({stats['correct']}/{stats['total']})")
     
     if save_results:
+        # metrics cover this run only; kept results follow this run's
+        evaluated = {question_hash(r.get("question", "")) for r in results}
+        kept = [r for h, r in (previous or {}).items() if h not in evaluated]
+        if kept:
+            logger.info(f"Keeping {len(kept)} earlier results for samples not evaluated in this run")
         output = {
             "metrics": metrics,
-            "results": results
+            "results": results + kept
         }
         
-        output_path = Path("evaluation_results.json")
+        output_path = results_path
         with output_path.open("w") as fp:
             json.dump(output, fp, ensure_ascii=False, indent=2)
         logger.info(f"\n Detailed results saved to {output_path}")
@@ -215,33 +320,10 @@ def evaluate_agent(
 
 
 def main():
-    """Main evaluation function."""
-    logger.info("Starting development set evaluation...")
-    
-    # Check if dev data exists
-    if not DEV_DATA_PATH.exists():
-        logger.error(f"Development data not found: {DEV_DATA_PATH}")
-        logger.info("This script requires development data with expected outputs")
-        return
-    
-    # Load dev data
-    dev_data = load_dev_data(DEV_DATA_PATH)
-    
-    # Initialize agent
-    logger.info("Initializing reasoning agent...")
-    agent = ReasoningAgent(
-        api_key="cse476",
-        api_base="http://10.4.58.53:41701/v1",
-        model="bens_model",
-        max_calls_per_question=18
-    )
-    
-   
-    num_samples = 50  # Change to None to evaluate all
-    
-    metrics = evaluate_agent(agent, dev_data, num_samples=num_samples)
-    
-    logger.info("\n Evaluation complete!")
+    # Kept for existing invocations; `python cli.py eval` takes the same flags
+    import sys
+    import cli
+    sys.exit(cli.main(["eval", *sys.argv[1:]]))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,86 @@
+import math
+import threading
+from collections import deque
+from typing import Dict, Any, Deque, Optional, Tuple
+
+
+class Hedger:
+    # Decides when a slow request gets a duplicate ("hedge"). Latencies are
+    # tracked per kind of call, since a 2048-token chain-of-thought and an
+    # 8-token synthesis have nothing in common; a request that has not
+    # answered by the `percentile` latency of its kind is hedged. Hedges are
+    # capped at `max_rate` of all requests so a slow backend is not sent
+    # twice its load, and nothing is hedged until a kind has `min_samples`
+    # latencies.
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        max_rate: float = 0.1,
+        min_samples: int = 20,
+        window: int = 256,
+        min_delay: float = 0.05,
+    ):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self._latencies: Dict[Tuple[str, bool], Deque[float]] = {}
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+        self._lock = threading.Lock()
+
+    def delay(self, kind: Optional[str], streaming: bool = False) -> Optional[float]:
+        # Seconds to wait before hedging, or None when the kind has too few
+        # latencies to say what slow is
+        with self._lock:
+            self.requests += 1
+        return self._delay(kind or "other", streaming)
+
+    def _delay(self, kind: str, streaming: bool) -> Optional[float]:
+        with self._lock:
+            latencies = self._latencies.get((kind, streaming))
+            if latencies is None or len(latencies) < self.min_samples:
+                return None
+            ordered = sorted(latencies)
+        # Nearest-rank percentile
+        rank = max(0, min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1))
+        return max(self.min_delay, ordered[rank])
+
+    def observe(self, kind: Optional[str], streaming: bool, latency: float) -> None:
+        key = (kind or "other", streaming)
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None:
+                latencies = self._latencies[key] = deque(maxlen=self.window)
+            latencies.append(latency)
+
+    def allow(self) -> bool:
+        with self._lock:
+            return self.hedges + 1 <= self.max_rate * self.requests
+
+    def record_hedge(self) -> None:
+        with self._lock:
+            self.hedges += 1
+
+    def record_win(self) -> None:
+        with self._lock:
+            self.wins += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            keys = sorted(self._latencies)
+            requests, hedges, wins = self.requests, self.hedges, self.wins
+        delays = {}
+        for kind, streaming in keys:
+            delay = self._delay(kind, streaming)
+            if delay is not None:
+                delays[f"{kind}/stream" if streaming else kind] = round(delay, 4)
+        return {
+            "requests": requests,
+            "hedges": hedges,
+            "hedge_rate": round(hedges / requests, 4) if requests else 0.0,
+            "hedge_wins": wins,
+            "delays_seconds": delays,
+        }
@@ -0,0 +1,66 @@
+import os
+import json
+import hashlib
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+def question_hash(question_text: str) -> str:
+    return hashlib.sha1(question_text.encode("utf-8")).hexdigest()
+
+
+class Journal:
+    # Append-only JSONL record of finished questions. Each record is written
+    # with a single write() followed by fsync, so a crash can at worst leave
+    # one truncated trailing line, which load() ignores and open() trims.
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._fd = None
+
+    def load(self) -> Dict[int, Dict[str, Any]]:
+        records = {}
+        if not self.path.exists():
+            return records
+        with self.path.open("r", encoding="utf-8") as fp:
+            for line in fp:
+                if not line.endswith("\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping unreadable journal line in {self.path}")
+                    continue
+                records[record["question_id"]] = record
+        logger.info(f"Loaded {len(records)} journal records from {self.path}")
+        return records
+
+    def open(self, resume: bool = False) -> None:
+        if not resume:
+            self.path.write_bytes(b"")
+        elif self.path.exists():
+            self._trim_partial_line()
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _trim_partial_line(self) -> None:
+        data = self.path.read_bytes()
+        if data and not data.endswith(b"\n"):
+            with self.path.open("r+b") as fp:
+                fp.truncate(data.rfind(b"\n") + 1)
+
+    def append(self, record: Dict[str, Any]) -> None:
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            written = 0
+            while written < len(line):
+                written += os.write(self._fd, line[written:])
+            os.fsync(self._fd)
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
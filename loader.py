@@ -0,0 +1,162 @@
+import os
+import json
+import codecs
+import logging
+from array import array
+from pathlib import Path
+from typing import Dict, Any, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 16
+_WHITESPACE = " \t\r\n"
+
+
+def _scan(path: Path) -> Iterator[Tuple[int, int, Dict[str, Any]]]:
+    # Yields (byte_offset, byte_length, record) for every record in a JSON
+    # array or JSONL file, reading the file a chunk at a time.
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    offset = 0  # byte offset of buf[pos]
+    is_array = None
+    finished = False
+
+    with Path(path).open("rb") as fp:
+        eof = False
+        while not finished:
+            # Skip separators between records
+            while pos < len(buf) and (buf[pos] in _WHITESPACE or (is_array and buf[pos] == ",")):
+                pos += 1
+                offset += 1
+
+            if pos >= len(buf) or (is_array is None and not buf[pos:].strip()):
+                if eof:
+                    break
+                chunk = fp.read(CHUNK_SIZE)
+                eof = not chunk
+                buf = buf[pos:] + utf8.decode(chunk, final=eof)
+                pos = 0
+                continue
+
+            if is_array is None:
+                if buf[pos] == "[":
+                    is_array = True
+                    pos += 1
+                    offset += 1
+                    continue
+                # Anything but a list in a .json file is a mistake, not JSONL
+                if Path(path).suffix == ".json":
+                    raise ValueError("Input file must contain a list of question objects.")
+                is_array = False
+
+            if is_array and buf[pos] == "]":
+                finished = True
+                break
+
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise ValueError(f"Malformed record at byte {offset} of {path}")
+                chunk = fp.read(CHUNK_SIZE)
+                eof = not chunk
+                buf = buf[pos:] + utf8.decode(chunk, final=eof)
+                pos = 0
+                continue
+
+            length = len(buf[pos:end].encode("utf-8"))
+            if not isinstance(record, dict):
+                raise ValueError("Input file must contain a list of question objects.")
+            # A JSONL record fits on one line; a record spanning several is
+            # a bare (pretty-printed) JSON object
+            if not is_array and "\n" in buf[pos:end]:
+                raise ValueError("Input file must contain a list of question objects.")
+            yield offset, length, record
+            offset += length
+            pos = end
+
+    if is_array and not finished:
+        raise ValueError(f"Unterminated JSON array in {path}")
+
+
+def iter_questions(path: Path) -> Iterator[Dict[str, Any]]:
+    # Streams question records from a JSON array or a JSONL file, so work can
+    # start on the first record before the rest of the file has been read.
+    count = 0
+    for _, _, record in _scan(path):
+        count += 1
+        yield record
+    logger.info(f"Read {count} records from {path}")
+
+
+class QuestionIndex:
+    # Byte-offset index over a question file for random access by position.
+    # The index is cached next to the file and rebuilt when the file changes.
+    def __init__(self, path: Path, offsets: array, lengths: array):
+        self.path = Path(path)
+        self.offsets = offsets
+        self.lengths = lengths
+
+    @staticmethod
+    def index_path(path: Path) -> Path:
+        return Path(str(path) + ".idx")
+
+    @staticmethod
+    def _signature(path: Path) -> Dict[str, int]:
+        st = os.stat(path)
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    @classmethod
+    def build(cls, path: Path, save: bool = True) -> "QuestionIndex":
+        offsets = array("q")
+        lengths = array("q")
+        for offset, length, _ in _scan(path):
+            offsets.append(offset)
+            lengths.append(length)
+        index = cls(path, offsets, lengths)
+        if save:
+            # The index is only a cache; a read-only directory just means
+            # it is rebuilt next time
+            try:
+                index.save()
+            except OSError as e:
+                logger.warning(f"Could not save index {cls.index_path(path)}: {e}")
+        return index
+
+    @classmethod
+    def load_or_build(cls, path: Path) -> "QuestionIndex":
+        idx_path = cls.index_path(path)
+        if idx_path.exists():
+            try:
+                with idx_path.open("r") as fp:
+                    data = json.load(fp)
+                if data["source"] == cls._signature(path):
+                    return cls(path, array("q", data["offsets"]), array("q", data["lengths"]))
+            except (ValueError, KeyError, OSError):
+                pass
+            logger.info(f"Rebuilding stale index {idx_path}")
+        return cls.build(path)
+
+    def save(self) -> None:
+        with self.index_path(self.path).open("w") as fp:
+            json.dump({
+                "source": self._signature(self.path),
+                "offsets": self.offsets.tolist(),
+                "lengths": self.lengths.tolist(),
+            }, fp)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        with self.path.open("rb") as fp:
+            fp.seek(self.offsets[i])
+            return json.loads(fp.read(self.lengths[i]))
+
+    def iter_range(self, start: int, stop: int) -> Iterator[Dict[str, Any]]:
+        with self.path.open("rb") as fp:
+            for i in range(start, min(stop, len(self))):
+                fp.seek(self.offsets[i])
+                yield json.loads(fp.read(self.lengths[i]))
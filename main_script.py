@@ -4,28 +4,22 @@ import json
 import logging
 import time
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Sized
 from agent import ReasoningAgent
+from concurrent.futures import Future
+from dedupe import QuestionDeduper
+from journal import Journal, question_hash
+from loader import iter_questions
+from utils import ordered_map
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-INPUT_PATH = Path("cse_476_final_project_test_data.json")
-OUTPUT_PATH = Path("cse_476_final_project_answers.json")
-LOG_PATH = Path("agent_execution_log.json")
 
-
-def load_questions(path: Path) -> List[Dict[str, Any]]:
-    logger.info(f"Loading questions from {path}")
-    with path.open("r") as fp:
-        data = json.load(fp)
-    if not isinstance(data, list):
-        raise ValueError("Input file must contain a list of question objects.")
-    logger.info(f"Loaded {len(data)} questions")
-    return data
+def load_questions(path: Path) -> Iterator[Dict[str, Any]]:
+    # Streams records (JSON array or JSONL) so solving starts on the first
+    # question while the rest of the file is still being read.
+    logger.info(f"Streaming questions from {path}")
+    return iter_questions(path)
 
 
 def save_answers(answers: List[Dict[str, str]], path: Path) -> None:
@@ -40,8 +34,14 @@ def save_execution_log(log_data: List[Dict[str, Any]], path: Path) -> None:
         json.dump(log_data, fp, ensure_ascii=False, indent=2)
 
 
+def save_metrics(agent: ReasoningAgent, path: Path) -> None:
+    logger.info(f"Saving API metrics to {path}")
+    with path.open("w") as fp:
+        fp.write(agent.client.metrics.to_prometheus())
+
+
 def validate_answers(
-    questions: List[Dict[str, Any]],
+    questions: Sized,
     answers: List[Dict[str, Any]]
 ) -> None:
     logger.info("Validating answers format...")
@@ -64,116 +64,225 @@ def validate_answers(
             )
 
 
+def solve_question(
+    agent: ReasoningAgent,
+    idx: int,
+    total: Optional[int],
+    question_data: Dict[str, Any]
+) -> tuple[Dict[str, str], Dict[str, Any]]:
+    q_start = time.time()
+    question_text = question_data.get("input", "")
+    domain = question_data.get("domain", None)
+
+    logger.info(f"Processing question {idx}/{total or '?'} (domain: {domain}): {question_text[:100]}...")
+
+    try:
+        result = agent.solve(question_text, domain=domain)
+        answer = result["answer"]
+        q_elapsed = time.time() - q_start
+        log_entry = {
+            "question_id": idx,
+            "domain": domain,
+            "question": question_text,
+            "answer": answer,
+            "technique": result["technique_used"],
+            "api_calls": result["call_count"],
+            "api_samples": result.get("sample_count", 0),
+            "budget_exhausted": result.get("budget", {}).get("exhausted", False),
+            "time_seconds": round(q_elapsed, 2),
+            "reasoning_summary": result["reasoning"][:500] if result["reasoning"] else ""
+        }
+        if "cascade" in result:
+            log_entry["cascade_confidence"] = result["cascade"]["confidence"]
+            log_entry["escalated"] = result["cascade"]["escalated"]
+
+        logger.info(
+            f"Question {idx}/{total or '?'} done: answer={answer!r} "
+            f"technique={result['technique_used']} calls={result['call_count']} "
+            f"time={q_elapsed:.2f}s"
+        )
+        return {"output": answer}, log_entry
+
+    except Exception as e:
+        logger.error(f"Error processing question {idx}: {e}")
+        return {"output": "Error: Unable to generate answer"}, {
+            "question_id": idx,
+            "domain": domain,
+            "question": question_text,
+            "error": str(e),
+            "time_seconds": round(time.time() - q_start, 2)
+        }
+
+
+def solve_duplicate(
+    idx: int,
+    question_data: Dict[str, Any],
+    dup: tuple[int, float],
+    representative: Future
+) -> tuple[Dict[str, str], Dict[str, Any]]:
+    q_start = time.time()
+    rep_idx, similarity = dup
+    answer = dict(representative.result())
+    logger.info(f"Question {idx} duplicates question {rep_idx} (similarity {similarity:.2f}); reusing its answer")
+    return answer, {
+        "question_id": idx,
+        "domain": question_data.get("domain", None),
+        "question": question_data.get("input", ""),
+        "answer": answer["output"],
+        "duplicate_of": rep_idx,
+        "similarity": round(similarity, 3),
+        "api_calls": 0,
+        "api_samples": 0,
+        "time_seconds": round(time.time() - q_start, 2)
+    }
+
+
+def reusable(record: Dict[str, Any]) -> bool:
+    # Failed and budget-cut answers are solved again on resume; outages and
+    # an exhausted run budget are the usual reasons to resume at all
+    output = (record.get("answer") or {}).get("output") or ""
+    log_entry = record.get("log") or {}
+    return (
+        bool(output.strip())
+        and not output.startswith("Error:")
+        and "error" not in log_entry
+        and not log_entry.get("budget_exhausted")
+    )
+
+
 def process_questions(
-    questions: List[Dict[str, Any]],
+    questions: Iterable[Dict[str, Any]],
     agent: ReasoningAgent,
-    save_interval: int = 10
+    workers: int = 1,
+    journal: Optional[Journal] = None,
+    resume: bool = False,
+    deduper: Optional[QuestionDeduper] = None,
+    first_id: int = 1
 ) -> tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+    # first_id is the question id of the first question, so a shard keeps
+    # the ids the questions have in the whole file
     answers = []
     execution_log = []
 
-    total = len(questions)
+    # Streamed input has no length up front
+    total = len(questions) if hasattr(questions, "__len__") else None
     start_time = time.time()
 
-    for idx, question_data in enumerate(questions, start=1):
-        q_start = time.time()
-        question_text = question_data.get("input", "")
-        domain = question_data.get("domain", None)
-
-        logger.info(f"\n{'='*60}")
-        logger.info(f"Processing question {idx}/{total}")
-        logger.info(f"Domain: {domain}")
-        logger.info(f"Question: {question_text[:100]}...")
-
-        try:
-            result = agent.solve(question_text, domain=domain)
-            answer = result["answer"]
-            answers.append({"output": answer})
-            q_elapsed = time.time() - q_start
-            log_entry = {
+    done = journal.load() if (journal is not None and resume) else {}
+    if journal is not None:
+        journal.open(resume=resume)
+    resumed = 0
+    # Answers of cluster representatives, awaited by their duplicates
+    representatives: Dict[int, Future] = {}
+
+    def assigned(items):
+        # Runs on the submitting thread, so every representative has its
+        # future (and has been submitted) before any duplicate waits on it.
+        for idx, question_data in items:
+            dup = None
+            if deduper is not None:
+                dup = deduper.assign(idx, question_data.get("input", ""), question_data.get("domain"))
+                if dup is None:
+                    representatives[idx] = Future()
+            yield idx, question_data, dup
+
+    def work(item):
+        idx, question_data, dup = item
+        q_hash = question_hash(question_data.get("input", ""))
+        future = representatives.get(idx)
+        record = done.get(idx)
+        if record is not None and record.get("input_hash") == q_hash and reusable(record):
+            if future is not None:
+                future.set_result(record["answer"])
+            # Journals written by the old generate_answers.py have no log
+            log_entry = record.get("log") or {
                 "question_id": idx,
-                "domain": domain,
-                "question": question_text,
-                "answer": answer,
-                "technique": result["technique_used"],
-                "api_calls": result["call_count"],
-                "time_seconds": round(q_elapsed, 2),
-                "reasoning_summary": result["reasoning"][:500] if result["reasoning"] else ""
+                "domain": question_data.get("domain", None),
+                "question": question_data.get("input", ""),
+                "answer": record["answer"].get("output", ""),
             }
+            return record["answer"], log_entry, True
+
+        if dup is not None:
+            answer, log_entry = solve_duplicate(idx, question_data, dup, representatives[dup[0]])
+        else:
+            try:
+                answer, log_entry = solve_question(agent, idx, total, question_data)
+            except BaseException as e:
+                if future is not None:
+                    future.set_exception(e)
+                raise
+            if future is not None:
+                future.set_result(answer)
+        # Journal as soon as a question finishes, not when its turn in the
+        # ordered output comes up, so a crash loses as little as possible.
+        if journal is not None:
+            journal.append({"question_id": idx, "input_hash": q_hash, "answer": answer, "log": log_entry})
+        return answer, log_entry, False
+
+    try:
+        results = ordered_map(work, assigned(enumerate(questions, start=first_id)), workers=workers)
+        for answer, log_entry, from_journal in results:
+            answers.append(answer)
             execution_log.append(log_entry)
+            resumed += from_journal
+    finally:
+        if journal is not None:
+            journal.close()
 
-            logger.info(f"Answer: {answer}")
-            logger.info(f"Technique: {result['technique_used']}")
-            logger.info(f"API calls: {result['call_count']}")
-            logger.info(f"Time: {q_elapsed:.2f}s")
-
-            if idx % save_interval == 0:
-                logger.info(f"\n>>> Saving progress at question {idx}/{total}")
-                save_answers(answers, OUTPUT_PATH)
-                save_execution_log(execution_log, LOG_PATH)
-
-            time.sleep(0.5)
-
-        except Exception as e:
-            logger.error(f"Error processing question {idx}: {e}")
-            answers.append({"output": "Error: Unable to generate answer"})
-            execution_log.append({
-                "question_id": idx,
-                "domain": domain,
-                "question": question_text,
-                "error": str(e),
-                "time_seconds": round(time.time() - q_start, 2)
-            })
+    total = len(answers)
+    if resumed:
+        logger.info(f"Reused {resumed}/{total} answers from {journal.path}")
 
     total_time = time.time() - start_time
     logger.info(f"\n{'='*60}")
     logger.info(f"Processing complete!")
     logger.info(f"Total time: {total_time:.2f}s")
-    logger.info(f"Average time per question: {total/total:.2f}s")
+    logger.info(f"Average time per question: {total_time/max(total, 1):.2f}s")
 
     summary = {
         "total_questions": total,
+        "resumed_questions": resumed,
+        "workers": workers,
         "total_time_seconds": round(total_time, 2),
-        "average_time_per_question": round(total_time / total, 2),
+        "average_time_per_question": round(total_time / max(total, 1), 2),
         "total_api_calls": sum(e.get("api_calls", 0) for e in execution_log),
+        "total_api_samples": sum(e.get("api_samples", 0) for e in execution_log),
         "average_api_calls_per_question": round(
-            sum(e.get("api_calls", 0) for e in execution_log) / total, 2
+            sum(e.get("api_calls", 0) for e in execution_log) / max(total, 1), 2
         )
     }
+    cache_stats = agent.client.cache_stats()
+    if cache_stats is not None:
+        summary["response_cache"] = cache_stats
+    summary["api_metrics"] = agent.client.metrics_stats()
+    summary["run_budget"] = agent.run_budget.stats()
+    if len(agent.client.backends) > 1:
+        summary["backends"] = agent.client.backend_stats()
+    if agent.client.hedger is not None:
+        summary["hedging"] = agent.client.hedge_stats()
+    if agent.client.sizer is not None:
+        summary["max_tokens_sizing"] = agent.client.sizer.stats()
+    cascaded = [e for e in execution_log if "escalated" in e]
+    if cascaded:
+        escalated = sum(e["escalated"] for e in cascaded)
+        summary["cascade"] = {
+            "questions": len(cascaded),
+            "escalated": escalated,
+            "escalation_rate": round(escalated / len(cascaded), 4),
+        }
+    if deduper is not None:
+        summary["deduplication"] = deduper.stats()
+        summary["duplicate_clusters"] = {str(rep): members for rep, members in deduper.clusters().items()}
     execution_log.insert(0, {"summary": summary})
     return answers, execution_log
 
 
-
-
 def main():
-    logger.info("Starting answer generation process...")
-
-    if not INPUT_PATH.exists():
-        logger.error(f"Input file not found: {INPUT_PATH}")
-        logger.error("Please ensure cse_476_final_project_test_data.json is in the current directory")
-        return
-
-    questions = load_questions(INPUT_PATH)
-
-    logger.info("Initializing reasoning agent...")
-    agent = ReasoningAgent(
-        api_key="cse476",
-        api_base="http://10.4.58.53:41701/v1",
-        model="bens_model",
-        max_calls_per_question=18
-    )
-
-    answers, execution_log = process_questions(questions, agent, save_interval=10)
-
-    save_answers(answers, OUTPUT_PATH)
-    save_execution_log(execution_log, LOG_PATH)
-
-    validate_answers(questions, answers)
-
-    logger.info(f"\nSuccessfully generated {len(answers)} answers")
-    logger.info(f"Answers saved to: {OUTPUT_PATH}")
-    logger.info(f"Execution log saved to: {LOG_PATH}")
+    # Kept for existing invocations; `python cli.py run` takes the same flags
+    import sys
+    import cli
+    sys.exit(cli.main(["run", *sys.argv[1:]]))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+import bisect
+import threading
+import contextvars
+import contextlib
+from collections import Counter
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+_current_technique: contextvars.ContextVar = contextvars.ContextVar("api_technique", default=None)
+
+
+def current_technique() -> str:
+    return _current_technique.get() or "other"
+
+
+@contextlib.contextmanager
+def technique(name: str) -> Iterator[None]:
+    # Labels every API call made inside the block (including tasks started
+    # from it). An outer label wins, so nested labels do not split the
+    # calls of the technique that was chosen.
+    if _current_technique.get() is not None:
+        yield
+        return
+    token = _current_technique.set(name)
+    try:
+        yield
+    finally:
+        _current_technique.reset(token)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        # Linear interpolation inside the bucket holding the q-th value, as
+        # Prometheus' histogram_quantile does.
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        out = []
+        for bound, c in zip(list(self.buckets) + [float("inf")], self.counts):
+            total += c
+            out.append(("+Inf" if bound == float("inf") else f"{bound:g}", total))
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "mean": round(self.sum / self.count, 4) if self.count else 0.0,
+            "p50": round(self.quantile(0.5), 4),
+            "p95": round(self.quantile(0.95), 4),
+            "p99": round(self.quantile(0.99), 4),
+            "buckets": dict(self.cumulative()),
+        }
+
+
+class _Series:
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.statuses = Counter()
+        self.latency = Histogram()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+
+class Metrics:
+    # Per-technique telemetry for every HTTP attempt an APIClient makes.
+    # Token prices are optional and only used for the cost estimate.
+    def __init__(self, prompt_cost_per_1k: float = 0.0, completion_cost_per_1k: float = 0.0):
+        self.prompt_cost_per_1k = prompt_cost_per_1k
+        self.completion_cost_per_1k = completion_cost_per_1k
+        self._series: Dict[str, _Series] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str) -> _Series:
+        series = self._series.get(name)
+        if series is None:
+            series = self._series[name] = _Series()
+        return series
+
+    def record_request(
+        self,
+        status: int,
+        latency: float,
+        retry: bool = False,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        technique_name: Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            series = self._get(technique_name or current_technique())
+            series.requests += 1
+            series.retries += retry
+            series.statuses[status] += 1
+            series.latency.observe(latency)
+            series.prompt_tokens += prompt_tokens
+            series.completion_tokens += completion_tokens
+
+    def record_cache_hit(self, technique_name: Optional[str] = None) -> None:
+        with self._lock:
+            self._get(technique_name or current_technique()).cache_hits += 1
+
+    def record_hedge(self, won: bool, technique_name: Optional[str] = None) -> None:
+        with self._lock:
+            series = self._get(technique_name or current_technique())
+            series.hedges += 1
+            series.hedge_wins += won
+
+    def _cost(self, series: _Series) -> float:
+        return (series.prompt_tokens * self.prompt_cost_per_1k
+                + series.completion_tokens * self.completion_cost_per_1k) / 1000.0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            techniques = {}
+            for name, s in sorted(self._series.items()):
+                techniques[name] = {
+                    "requests": s.requests,
+                    "retries": s.retries,
+                    "cache_hits": s.cache_hits,
+                    "hedges": s.hedges,
+                    "hedge_wins": s.hedge_wins,
+                    "status_codes": {str(k): v for k, v in sorted(s.statuses.items())},
+                    "latency_seconds": s.latency.to_dict(),
+                    "prompt_tokens": s.prompt_tokens,
+                    "completion_tokens": s.completion_tokens,
+                    "cost": round(self._cost(s), 6),
+                }
+            totals = {
+                "requests": sum(t["requests"] for t in techniques.values()),
+                "retries": sum(t["retries"] for t in techniques.values()),
+                "cache_hits": sum(t["cache_hits"] for t in techniques.values()),
+                "hedges": sum(t["hedges"] for t in techniques.values()),
+                "hedge_wins": sum(t["hedge_wins"] for t in techniques.values()),
+                "prompt_tokens": sum(t["prompt_tokens"] for t in techniques.values()),
+                "completion_tokens": sum(t["completion_tokens"] for t in techniques.values()),
+                "latency_seconds": round(sum(s.latency.sum for s in self._series.values()), 4),
+                "cost": round(sum(t["cost"] for t in techniques.values()), 6),
+            }
+        return {"totals": totals, "techniques": techniques}
+
+    def to_prometheus(self, prefix: str = "reasoning_agent") -> str:
+        lines = []
+
+        def header(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        with self._lock:
+            series = sorted(self._series.items())
+
+            header("api_request_duration_seconds", "histogram", "Latency of API requests.")
+            for name, s in series:
+                for le, count in s.latency.cumulative():
+                    lines.append(f'{prefix}_api_request_duration_seconds_bucket{{technique="{name}",le="{le}"}} {count}')
+                lines.append(f'{prefix}_api_request_duration_seconds_sum{{technique="{name}"}} {s.latency.sum:.6f}')
+                lines.append(f'{prefix}_api_request_duration_seconds_count{{technique="{name}"}} {s.latency.count}')
+
+            header("api_requests_total", "counter", "API requests by response status (-1: no response).")
+            for name, s in series:
+                for status, count in sorted(s.statuses.items()):
+                    lines.append(f'{prefix}_api_requests_total{{technique="{name}",status="{status}"}} {count}')
+
+            header("api_retries_total", "counter", "API requests that were retries of an earlier attempt.")
+            for name, s in series:
+                lines.append(f'{prefix}_api_retries_total{{technique="{name}"}} {s.retries}')
+
+            header("api_cache_hits_total", "counter", "Calls answered from the response cache.")
+            for name, s in series:
+                lines.append(f'{prefix}_api_cache_hits_total{{technique="{name}"}} {s.cache_hits}')
+
+            header("api_hedges_total", "counter", "Duplicate requests sent for slow calls, by whether they answered first.")
+            for name, s in series:
+                lines.append(f'{prefix}_api_hedges_total{{technique="{name}",won="true"}} {s.hedge_wins}')
+                lines.append(f'{prefix}_api_hedges_total{{technique="{name}",won="false"}} {s.hedges - s.hedge_wins}')
+
+            header("api_tokens_total", "counter", "Tokens reported by the server.")
+            for name, s in series:
+                lines.append(f'{prefix}_api_tokens_total{{technique="{name}",kind="prompt"}} {s.prompt_tokens}')
+                lines.append(f'{prefix}_api_tokens_total{{technique="{name}",kind="completion"}} {s.completion_tokens}')
+
+            header("api_cost_total", "counter", "Estimated cost from the configured token prices.")
+            for name, s in series:
+                lines.append(f'{prefix}_api_cost_total{{technique="{name}"}} {self._cost(s):.6f}')
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    # "fixed:0.2", "uniform:0.1:0.5", "exponential:0.3" (mean),
+    # "lognormal:0.3:0.5" (median, sigma) or a bare number of seconds.
+    name, _, rest = spec.partition(":")
+    try:
+        args = [float(a) for a in rest.split(":")] if rest else []
+        if not rest and name:
+            return _fixed(float(name))
+    except ValueError:
+        raise ValueError(f"Bad latency spec {spec!r}")
+    if name == "fixed" and len(args) == 1:
+        return _fixed(args[0])
+    if name == "uniform" and len(args) == 2:
+        low, high = args
+        return lambda rng: rng.uniform(low, high)
+    if name == "exponential" and len(args) == 1:
+        mean = args[0]
+        return lambda rng: rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+    if name == "lognormal" and len(args) == 2:
+        median, sigma = args
+        return lambda rng: median * rng.lognormvariate(0.0, sigma)
+    raise ValueError(f"Bad latency spec {spec!r}")
+
+
+def _fixed(seconds: float) -> Callable[[random.Random], float]:
+    return lambda rng: seconds
+
+
+def _default_response(system: str, prompt: str, rng: random.Random, wrong_rate: float) -> str:
+    # Shaped like what the techniques expect: numbered steps for a
+    # decomposition request, otherwise some reasoning and a final answer line
+    # followed by trailing text (so early stopping has something to skip).
+    if prompt.startswith("Break down this problem"):
+        return (
+            "1. Identify the quantities given in the problem\n"
+            "2. Work out the intermediate value from those quantities (depends on: 1)\n"
+            "3. Check the units and constraints stated in the question\n"
+            "4. Combine the intermediate value with the constraints (depends on: 2, 3)\n"
+        )
+    answer = "42" if rng.random() >= wrong_rate else str(rng.randint(0, 99))
+    return (
+        "Let me work through this carefully.\n"
+        "First, restate what is being asked.\n"
+        "Then apply the relevant rule to the numbers given.\n"
+        f"The final answer is {answer}.\n"
+        "To double check, the steps above are consistent with the question.\n"
+        "No further work is needed.\n"
+    )
+
+
+class MockState:
+    # Behaviour and counters shared by every request handler thread.
+    def __init__(
+        self,
+        latency: str = "fixed:0.05",
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: Optional[float] = 0.2,
+        wrong_rate: float = 0.0,
+        supports_n: bool = True,
+        stream_chunk_delay: float = 0.01,
+        canned: Optional[List[Dict[str, str]]] = None,
+        seed: Optional[int] = None,
+        capacity: Optional[int] = None,
+    ):
+        self.latency = parse_latency(latency)
+        # Like a GPU replica, at most `capacity` completions are generated
+        # at once; the rest queue for a slot
+        self.slots = threading.Semaphore(capacity) if capacity else None
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.wrong_rate = wrong_rate
+        self.supports_n = supports_n
+        self.stream_chunk_delay = stream_chunk_delay
+        # Canned responses: the first entry whose "match" regex is found in
+        # the prompt supplies the completion text.
+        self.canned = [(re.compile(c["match"]), c["response"]) for c in (canned or [])]
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def draw(self, fn: Callable[[random.Random], Any]) -> Any:
+        with self._lock:
+            return fn(self.rng)
+
+    def completion(self, system: str, prompt: str) -> str:
+        for pattern, response in self.canned:
+            if pattern.search(prompt):
+                return response
+        return self.draw(lambda rng: _default_response(system, prompt, rng, self.wrong_rate))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: MockState = None
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        try:
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on the request (a timeout or a hedge that lost)
+            self.state.count("cancelled")
+            self.close_connection = True
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/models"):
+            self.state.count("models")
+            self._send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": f"No route for {self.path}"}})
+
+    def do_POST(self) -> None:
+        state = self.state
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Request body is not JSON"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"No route for {self.path}"}})
+            return
+
+        state.count("requests")
+        if state.slots is not None:
+            with state.slots:
+                time.sleep(state.draw(state.latency))
+        else:
+            time.sleep(state.draw(state.latency))
+
+        roll = state.draw(lambda rng: rng.random())
+        if roll < state.rate_limit_rate:
+            state.count("429")
+            headers = {"Retry-After": f"{state.retry_after:g}"} if state.retry_after is not None else {}
+            self._send_json(429, {"error": {"message": "Rate limit exceeded"}}, headers)
+            return
+        if roll < state.rate_limit_rate + state.error_rate:
+            state.count("500")
+            self._send_json(500, {"error": {"message": "Injected server error"}})
+            return
+
+        n = int(request.get("n", 1))
+        if n > 1 and not state.supports_n:
+            state.count("400")
+            self._send_json(400, {"error": {"message": "n > 1 is not supported"}})
+            return
+
+        messages = request.get("messages", [])
+        system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        prompt = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        texts = [state.completion(system, prompt) for _ in range(n)]
+        # Completions are cut off at max_tokens (4 characters per token)
+        max_tokens = int(request.get("max_tokens", 1024))
+        reasons = ["length" if len(t) // 4 > max_tokens else "stop" for t in texts]
+        texts = [t[:max_tokens * 4] for t in texts]
+
+        if request.get("stream") and n == 1:
+            state.count("streamed")
+            self._stream(texts[0], reasons[0])
+            return
+
+        state.count("200")
+        self._send_json(200, {
+            "object": "chat.completion",
+            "model": request.get("model", "mock-model"),
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": t}, "finish_reason": r}
+                for i, (t, r) in enumerate(zip(texts, reasons))
+            ],
+            "usage": {
+                "prompt_tokens": (len(system) + len(prompt)) // 4,
+                "completion_tokens": sum(len(t) // 4 for t in texts),
+            },
+        })
+
+    def _stream(self, text: str, finish_reason: str = "stop") -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(payload) -> None:
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        try:
+            for line in text.splitlines(keepends=True):
+                event(json.dumps({"choices": [{"index": 0, "delta": {"content": line}, "finish_reason": None}]}))
+                time.sleep(self.state.stream_chunk_delay)
+            event(json.dumps({
+                "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+                "usage": {"completion_tokens": len(text) // 4},
+            }))
+            event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up early (stop_when), which is expected
+            self.state.count("stream_cancelled")
+            self.close_connection = True
+
+
+class MockServer:
+    # Local stand-in for an OpenAI-compatible /v1/chat/completions endpoint,
+    # run on a background thread. Use as a context manager or start()/stop().
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **behaviour):
+        self.state = MockState(**behaviour)
+        handler = type("MockHandler", (_Handler,), {"state": self.state})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-server", daemon=True)
+        self._thread.start()
+        logger.info(f"Mock server listening on {self.url}")
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        return self.state.stats()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def add_behaviour_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", default="fixed:0.05",
+                        help="Latency distribution: fixed:S, uniform:LO:HI, exponential:MEAN "
+                             "or lognormal:MEDIAN:SIGMA (default: fixed:0.05)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with a 500 (default: 0)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with a 429 (default: 0)")
+    parser.add_argument("--retry-after", type=float, default=0.2,
+                        help="Retry-After seconds sent with injected 429s (default: 0.2)")
+    parser.add_argument("--wrong-rate", type=float, default=0.0,
+                        help="Fraction of completions with a random instead of the expected answer")
+    parser.add_argument("--no-n", action="store_true",
+                        help="Reject requests with n > 1 like servers that do not support it")
+    parser.add_argument("--canned", metavar="PATH", default=None,
+                        help='JSON list of {"match": regex, "response": text} canned completions')
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latency and error draws")
+    parser.add_argument("--capacity", type=int, default=None,
+                        help="Completions generated at once; further requests queue (default: unlimited)")
+
+
+def behaviour_from_args(args: argparse.Namespace) -> Dict[str, Any]:
+    canned = None
+    if args.canned:
+        with open(args.canned, "r", encoding="utf-8") as fp:
+            canned = json.load(fp)
+    return {
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "retry_after": args.retry_after,
+        "wrong_rate": args.wrong_rate,
+        "supports_n": not args.no_n,
+        "canned": canned,
+        "seed": args.seed,
+        "capacity": args.capacity,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run a local mock OpenAI-compatible chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_behaviour_args(parser)
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    server = MockServer(args.host, args.port, **behaviour_from_args(args))
+    logger.info(f"Serving on {server.url} (Ctrl-C to stop)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+        logger.info(f"Request counts: {server.stats()}")
+
+
+if __name__ == "__main__":
+    main()
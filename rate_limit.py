@@ -0,0 +1,210 @@
+import time
+import random
+import asyncio
+import threading
+import logging
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def is_retryable(status: int) -> bool:
+    return status == -1 or status in RETRYABLE_STATUSES
+
+
+def is_overload(status: int) -> bool:
+    return status == 429 or status >= 500
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(
+    attempt: int,
+    retry_after: Optional[float] = None,
+    base: float = 0.5,
+    cap: float = 30.0,
+) -> float:
+    # Exponential backoff with full jitter; a server-provided Retry-After
+    # always wins (capped so a bad header cannot stall a run).
+    if retry_after is not None:
+        return min(retry_after, cap)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    # Classic token bucket. take() may drive the level negative (e.g. when a
+    # completion turns out longer than estimated); later takes then wait for
+    # the debt to refill.
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def charge(self, amount: float) -> None:
+        with self._lock:
+            self._refill()
+            self._level -= amount
+
+    async def take(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._level >= amount:
+                    self._level -= amount
+                    return
+                wait = (amount - self._level) / self.rate
+            await asyncio.sleep(wait)
+
+
+class AIMDLimiter:
+    # Concurrency limit that grows by about one slot per round trip while
+    # requests succeed and halves on overload (429/5xx/timeouts) or when
+    # latency climbs well above its best observed level.
+    def __init__(
+        self,
+        initial: int = 8,
+        minimum: int = 1,
+        maximum: int = 64,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 3.0,
+        decrease_cooldown: float = 1.0,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.decrease_cooldown = decrease_cooldown
+        self.in_flight = 0
+        self.decreases = 0
+        self._latency = None
+        self._baseline = None
+        self._last_decrease = 0.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self) -> None:
+        while True:
+            with self._lock:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    # _wake() has already popped a waiter it handed a slot
+                    # to, even if the wakeup has not run yet
+                    handed = waiter not in self._waiters
+                    if not handed:
+                        self._waiters.remove(waiter)
+                # Pass the slot on, or the next waiter is never woken
+                if handed:
+                    self._wake()
+                raise
+
+    def _wake(self) -> None:
+        with self._lock:
+            free = int(self.limit) - self.in_flight
+            while free > 0 and self._waiters:
+                waiter = self._waiters.popleft()
+                free -= 1
+                waiter.get_loop().call_soon_threadsafe(_resolve, waiter)
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded:
+                self._decrease(now)
+            elif latency is not None:
+                self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+                if self._baseline is None or self._latency < self._baseline:
+                    self._baseline = self._latency
+                if self._latency > self._baseline * self.latency_tolerance:
+                    self._decrease(now)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def _decrease(self, now: float) -> None:
+        # At most one decrease per cooldown, so a burst of 429s from a
+        # single overload event is not punished several times over.
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+        self.decreases += 1
+        logger.info(f"Reducing request concurrency to {int(self.limit)}")
+
+
+def _resolve(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class RateLimiter:
+    # Shared admission control for an APIClient: optional request and token
+    # rate buckets plus an adaptive concurrency limit.
+    def __init__(
+        self,
+        requests_per_second: Optional[float] = None,
+        tokens_per_second: Optional[float] = None,
+        initial_concurrency: int = 8,
+        max_concurrency: int = 64,
+    ):
+        self.requests = TokenBucket(requests_per_second) if requests_per_second else None
+        self.tokens = TokenBucket(tokens_per_second) if tokens_per_second else None
+        self.concurrency = AIMDLimiter(
+            initial=min(initial_concurrency, max_concurrency), maximum=max_concurrency
+        )
+        self.overloads = 0
+
+    async def acquire(self, estimated_tokens: int = 0) -> None:
+        if self.requests is not None:
+            await self.requests.take(1)
+        if self.tokens is not None and estimated_tokens:
+            await self.tokens.take(estimated_tokens)
+        await self.concurrency.acquire()
+
+    def release(self, latency: Optional[float], overloaded: bool = False) -> None:
+        if overloaded:
+            self.overloads += 1
+        self.concurrency.release(latency=None if overloaded else latency, overloaded=overloaded)
+
+    def charge_tokens(self, tokens: int) -> None:
+        if self.tokens is not None and tokens > 0:
+            self.tokens.charge(tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+            "overloads": self.overloads,
+            "decreases": self.concurrency.decreases,
+        }
@@ -0,0 +1,168 @@
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    # Content-addressed cache of successful completions in a single SQLite
+    # file. Entries are keyed by everything that determines the response and
+    # evicted least-recently-used first once max_entries or max_bytes is hit.
+    # aget/aput run the SQLite work on a private thread so an event loop
+    # never blocks on the file.
+    TOUCH_BATCH = 64
+
+    def __init__(
+        self,
+        path: str = "api_cache.sqlite3",
+        max_entries: int = 100_000,
+        max_bytes: Optional[int] = 512 * 1024 * 1024,
+        deterministic_only: bool = True,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.deterministic_only = deterministic_only
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+        # Hits since the last flush; their last_used is written in batches
+        self._touched: Dict[str, float] = {}
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used)")
+        row = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        self._entries, self._bytes = row
+
+    @staticmethod
+    def make_key(
+        model: str, system: str, prompt: str, temperature: float, max_tokens: int, n: int = 1,
+        sample: int = 0, stop: Optional[str] = None,
+    ) -> str:
+        # sample is the index of the first sample a sampled (temperature > 0)
+        # call stands for, so repeated calls with one prompt are cached
+        # separately; stop names the early-stopping predicate of a streamed
+        # call. Both are left out when unset, keeping older keys valid.
+        fields = [model, system, prompt, float(temperature), int(max_tokens), int(n)]
+        if sample or stop:
+            fields += [int(sample), stop]
+        material = json.dumps(fields, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def cacheable(self, temperature: float) -> bool:
+        return not self.deterministic_only or temperature == 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.TOUCH_BATCH:
+                self._flush_touches()
+        return json.loads(row[0])
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.get, key)
+
+    async def aput(self, key: str, value: Dict[str, Any]) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.put, key, value)
+
+    def _flush_touches(self) -> None:
+        if self._touched:
+            self._db.executemany(
+                "UPDATE responses SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()],
+            )
+            self._touched = {}
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, data, size, time.time()),
+            )
+            if old is None:
+                self._entries += 1
+                self._bytes += size
+            else:
+                self._bytes += size - old[0]
+            self._touched.pop(key, None)
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._entries > self.max_entries or (
+            self.max_bytes is not None and self._bytes > self.max_bytes and self._entries > 1
+        ):
+            self._flush_touches()
+            excess = max(self._entries - self.max_entries, 1)
+            rows = self._db.execute(
+                "SELECT key, size FROM responses ORDER BY last_used ASC LIMIT ?", (excess,)
+            ).fetchall()
+            if not rows:
+                break
+            self._db.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k, _ in rows])
+            self._entries -= len(rows)
+            self._bytes -= sum(size for _, size in rows)
+            self.evictions += len(rows)
+
+    def invalidate(self, key: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._touched.pop(key, None)
+            self._entries -= 1
+            self._bytes -= row[0]
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._touched = {}
+            self._entries = 0
+            self._bytes = 0
+        logger.info(f"Cleared response cache at {self.path}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._flush_touches()
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": self._entries,
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._flush_touches()
+            self._db.close()
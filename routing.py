@@ -0,0 +1,167 @@
+import time
+import random
+import threading
+import logging
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("least_outstanding", "ewma")
+
+
+def parse_api_bases(api_base: Union[str, Sequence[str]]) -> List[str]:
+    # One base URL, a comma-separated list, or a sequence of them
+    if isinstance(api_base, str):
+        api_base = api_base.split(",")
+    bases = [b.strip().rstrip("/") for b in api_base if b and b.strip()]
+    if not bases:
+        raise ValueError("At least one API base URL is required")
+    return bases
+
+
+class Backend:
+    def __init__(self, base: str):
+        self.base = base
+        self.url = f"{base}/chat/completions"
+        self.outstanding = 0
+        # Smoothed seconds per completion token of successful requests
+        self.ewma: Optional[float] = None
+        self.failures = 0
+        self.down = False
+        self.retry_at = 0.0
+        self.checking = False
+        self.requests = 0
+        self.errors = 0
+        self.removals = 0
+        # Removals and failed health checks since the last successful
+        # request; each one doubles the next cooldown
+        self.strikes = 0
+
+
+class BackendPool:
+    # Routes each request to one of several OpenAI-compatible replicas:
+    # the one with the fewest requests in flight ("least_outstanding"), or
+    # the lowest expected wait, smoothed latency x (in flight + 1) ("ewma").
+    # A backend with `failure_threshold` consecutive failures (no response
+    # or a 5xx) leaves the rotation; after `cooldown` seconds the client
+    # health-checks it and puts it back once it answers.
+    def __init__(
+        self,
+        bases: Iterable[str],
+        policy: str = "least_outstanding",
+        failure_threshold: int = 3,
+        cooldown: float = 5.0,
+        max_cooldown: float = 60.0,
+        alpha: float = 0.3,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown routing policy {policy!r}; expected one of {POLICIES}")
+        self.backends = [Backend(b) for b in bases]
+        self.policy = policy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    def _score(self, b: Backend) -> tuple:
+        if self.policy == "ewma":
+            # Untried backends go first so every replica gets measured
+            return ((b.ewma or 0.0) * (b.outstanding + 1), b.outstanding)
+        return (b.outstanding,)
+
+    def pick(self, exclude: Iterable[Backend] = ()) -> Backend:
+        # Healthy backends not in `exclude` (those that already failed this
+        # call) are preferred; if every backend is out, the one due back
+        # soonest is used rather than failing without trying.
+        if len(self.backends) == 1:
+            return self.backends[0]
+        exclude = set(exclude)
+        with self._lock:
+            healthy = [b for b in self.backends if not b.down]
+            candidates = [b for b in healthy if b not in exclude] or healthy
+            if not candidates:
+                return min(self.backends, key=lambda b: b.retry_at)
+            best = min(self._score(b) for b in candidates)
+            # Ties are broken at random so idle replicas share the load
+            return self._rng.choice([b for b in candidates if self._score(b) == best])
+
+    def start(self, backend: Backend) -> None:
+        with self._lock:
+            backend.outstanding += 1
+            backend.requests += 1
+
+    def finish(self, backend: Backend, ok: Optional[bool], seconds_per_token: Optional[float] = None) -> None:
+        # ok=None: the request ended without saying anything about the
+        # backend's health (a 4xx, a 429, or the caller cancelled it)
+        with self._lock:
+            backend.outstanding -= 1
+            if ok is None:
+                return
+            if ok:
+                backend.failures = 0
+                backend.strikes = 0
+                if seconds_per_token is not None:
+                    backend.ewma = (seconds_per_token if backend.ewma is None
+                                    else self.alpha * seconds_per_token + (1 - self.alpha) * backend.ewma)
+                return
+            backend.errors += 1
+            backend.failures += 1
+            if not backend.down and backend.failures >= self.failure_threshold and len(self.backends) > 1:
+                backend.down = True
+                backend.removals += 1
+                backend.strikes += 1
+                backend.retry_at = time.monotonic() + self._cooldown(backend)
+                logger.warning(
+                    f"Backend {backend.base} out of rotation after {backend.failures} consecutive failures"
+                )
+
+    def due_for_check(self) -> List[Backend]:
+        # Backends whose cooldown is over and that are not being checked yet;
+        # the caller runs the checks and reports with check_result().
+        now = time.monotonic()
+        with self._lock:
+            due = [b for b in self.backends if b.down and not b.checking and b.retry_at <= now]
+            for b in due:
+                b.checking = True
+            return due
+
+    def check_result(self, backend: Backend, healthy: bool) -> None:
+        with self._lock:
+            backend.checking = False
+            if healthy:
+                backend.down = False
+                backend.failures = 0
+                # Forget the latency it had while failing
+                backend.ewma = None
+                logger.info(f"Backend {backend.base} passed its health check; back in rotation")
+                return
+            backend.strikes += 1
+            backend.retry_at = time.monotonic() + self._cooldown(backend)
+
+    def _cooldown(self, backend: Backend) -> float:
+        # A backend that keeps failing, whether its health checks or its
+        # requests right after passing one, is left out for longer each time
+        return min(self.max_cooldown, self.cooldown * 2 ** min(backend.strikes - 1, 10))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "backends": [
+                    {
+                        "base": b.base,
+                        "requests": b.requests,
+                        "errors": b.errors,
+                        "outstanding": b.outstanding,
+                        "healthy": not b.down,
+                        "removals": b.removals,
+                        "ms_per_token": round(b.ewma * 1000, 3) if b.ewma is not None else None,
+                    }
+                    for b in self.backends
+                ],
+            }
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+import re
+import json
+import math
+import time
+import random
+import argparse
+import logging
+from pathlib import Path
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Iterable
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = Path("strategy_model.json")
+
+# Technique names as logged -> strategy names used by ReasoningAgent
+TECHNIQUE_TO_STRATEGY = {
+    "chain_of_thought": "cot",
+    "self_consistency": "self_consistency",
+    "decomposition": "decomposition",
+}
+# Calls per question assumed until training data says otherwise
+DEFAULT_COSTS = {"cot": 1.0, "self_consistency": 5.0, "decomposition": 6.0}
+
+_TOKEN_RE = re.compile(r"[a-z]+|\d+")
+
+
+def features(question: str, domain: Optional[str] = None) -> List[str]:
+    # Word unigrams and bigrams (numbers collapsed to one token), the domain
+    # and a coarse length bucket.
+    tokens = ["<num>" if t.isdigit() else t for t in _TOKEN_RE.findall(question.lower())]
+    feats = set(tokens)
+    feats.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    feats.add(f"domain={domain or 'unknown'}")
+    feats.add(f"len={min(len(question).bit_length(), 12)}")
+    return list(feats)
+
+
+def _sigmoid(z: float) -> float:
+    z = max(-30.0, min(30.0, z))
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+class StrategyModel:
+    # Per-technique logistic regression estimate of P(correct | question
+    # features). predict() returns the cheapest technique whose estimate
+    # clears the threshold, or the most likely one if none does.
+    def __init__(self, techniques: Dict[str, Dict[str, Any]], threshold: float = 0.7):
+        self.techniques = techniques
+        self.threshold = threshold
+        self._by_cost = sorted(techniques, key=lambda name: techniques[name]["cost"])
+
+    def probabilities(self, question: str, domain: Optional[str] = None) -> Dict[str, float]:
+        feats = features(question, domain)
+        # Features are scaled so a long question does not swamp the bias
+        scale = 1.0 / math.sqrt(len(feats))
+        probs = {}
+        for name, t in self.techniques.items():
+            weights = t["weights"]
+            probs[name] = _sigmoid(t["bias"] + scale * sum(weights.get(f, 0.0) for f in feats))
+        return probs
+
+    def predict(self, question: str, domain: Optional[str] = None) -> str:
+        probs = self.probabilities(question, domain)
+        for name in self._by_cost:
+            if probs[name] >= self.threshold:
+                return name
+        return max(self._by_cost, key=lambda name: probs[name])
+
+    @classmethod
+    def train(
+        cls,
+        examples: Iterable[Dict[str, Any]],
+        costs: Optional[Dict[str, float]] = None,
+        threshold: float = 0.7,
+        min_examples: int = 5,
+        epochs: int = 30,
+        learning_rate: float = 0.5,
+        l2: float = 1e-3,
+        seed: int = 476,
+    ) -> "StrategyModel":
+        # examples: {"question", "domain", "strategy", "correct"} records.
+        # Plain SGD on the log loss with L2, one model per technique.
+        by_strategy: Dict[str, List] = defaultdict(list)
+        for ex in examples:
+            feats = features(ex["question"], ex.get("domain"))
+            by_strategy[ex["strategy"]].append((feats, 1.0 if ex["correct"] else 0.0))
+
+        costs = dict(DEFAULT_COSTS, **(costs or {}))
+        rng = random.Random(seed)
+        techniques = {}
+        for name, rows in sorted(by_strategy.items()):
+            if len(rows) < min_examples:
+                logger.warning(f"Skipping {name}: only {len(rows)} labelled examples")
+                continue
+            positives = sum(label for _, label in rows)
+            # Start from the base rate so rare features only move it
+            bias = math.log((positives + 1) / (len(rows) - positives + 1))
+            weights: Dict[str, float] = defaultdict(float)
+            for epoch in range(epochs):
+                rng.shuffle(rows)
+                lr = learning_rate / (1 + epoch)
+                for feats, label in rows:
+                    scale = 1.0 / math.sqrt(len(feats))
+                    error = _sigmoid(bias + scale * sum(weights[f] for f in feats)) - label
+                    bias -= lr * error
+                    for f in feats:
+                        weights[f] -= lr * (error * scale + l2 * weights[f])
+            techniques[name] = {
+                "bias": bias,
+                "weights": {f: round(w, 6) for f, w in weights.items() if abs(w) > 1e-6},
+                "cost": costs.get(name, 1.0),
+                "examples": {"1": int(positives), "0": len(rows) - int(positives)},
+            }
+        if not techniques:
+            raise ValueError("Not enough labelled examples to train a strategy model")
+        return cls(techniques, threshold)
+
+    def save(self, path: Path) -> None:
+        with Path(path).open("w") as fp:
+            json.dump({"version": 1, "threshold": self.threshold, "techniques": self.techniques}, fp)
+
+    @classmethod
+    def load(cls, path: Path) -> "StrategyModel":
+        with Path(path).open("r") as fp:
+            data = json.load(fp)
+        return cls(data["techniques"], data.get("threshold", 0.7))
+
+
+def load_examples(results_paths: List[Path]) -> List[Dict[str, Any]]:
+    # Labelled examples from evaluation_results.json files
+    examples = []
+    for path in results_paths:
+        with Path(path).open("r") as fp:
+            data = json.load(fp)
+        for r in data.get("results", []):
+            strategy = TECHNIQUE_TO_STRATEGY.get(r.get("technique"))
+            if strategy is None or "error" in r:
+                continue
+            examples.append({
+                "question": r.get("question", ""),
+                "domain": r.get("domain"),
+                "strategy": strategy,
+                "correct": bool(r.get("correct", False)),
+                "api_calls": r.get("api_calls", 0),
+            })
+    return examples
+
+
+def load_costs(examples: List[Dict[str, Any]], log_paths: List[Path]) -> Dict[str, float]:
+    # Average calls per question for each strategy, from evaluation results
+    # and (unlabelled) agent_execution_log.json files.
+    calls = defaultdict(list)
+    for ex in examples:
+        calls[ex["strategy"]].append(ex["api_calls"])
+    for path in log_paths:
+        with Path(path).open("r") as fp:
+            entries = json.load(fp)
+        for entry in entries:
+            strategy = TECHNIQUE_TO_STRATEGY.get(entry.get("technique"))
+            if strategy is not None and "api_calls" in entry and not entry.get("duplicate_of"):
+                calls[strategy].append(entry["api_calls"])
+    return {name: sum(c) / len(c) for name, c in calls.items() if c}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Train or query the strategy selection model.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train = sub.add_parser("train", help="Train a model from evaluation results")
+    train.add_argument("--results", type=Path, nargs="+", default=[Path("evaluation_results.json")],
+                       help="evaluation_results.json files with labelled samples")
+    train.add_argument("--log", type=Path, nargs="*", default=[],
+                       help="agent_execution_log.json files used for per-technique call costs")
+    train.add_argument("--output", type=Path, default=MODEL_PATH,
+                       help=f"Where to write the model (default: {MODEL_PATH})")
+    train.add_argument("--threshold", type=float, default=0.7,
+                       help="P(correct) needed to prefer a cheaper technique (default: 0.7)")
+    train.add_argument("--min-examples", type=int, default=5,
+                       help="Techniques with fewer labelled examples are left out (default: 5)")
+
+    predict = sub.add_parser("predict", help="Show the strategy chosen for a question")
+    predict.add_argument("question")
+    predict.add_argument("--domain", default=None)
+    predict.add_argument("--model", type=Path, default=MODEL_PATH)
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+
+    if args.command == "train":
+        examples = load_examples(args.results)
+        costs = load_costs(examples, args.log)
+        model = StrategyModel.train(examples, costs, args.threshold, args.min_examples)
+        model.save(args.output)
+        for name, t in sorted(model.techniques.items()):
+            logger.info(
+                f"{name}: {t['examples']['1']} correct / {t['examples']['0']} incorrect, "
+                f"{t['cost']:.2f} calls per question"
+            )
+        logger.info(f"Saved strategy model to {args.output}")
+    else:
+        model = StrategyModel.load(args.model)
+        start = time.perf_counter()
+        choice = model.predict(args.question, args.domain)
+        elapsed = time.perf_counter() - start
+        probs = model.probabilities(args.question, args.domain)
+        print(f"strategy: {choice}  ({elapsed * 1e6:.0f} us)")
+        for name, p in sorted(probs.items(), key=lambda kv: model.techniques[kv[0]]["cost"]):
+            print(f"  {name:<18} P(correct)={p:.3f}  cost={model.techniques[name]['cost']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
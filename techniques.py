@@ -1,133 +1,361 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+import re
+import asyncio
 import logging
-from api_client import APIClient
-from utils import extract_final_answer
+from collections import Counter
+from api_client import APIClient, run_sync, current_budget
+from utils import extract_final_answer, final_answer_emitted
 
 logger = logging.getLogger(__name__)
 
 
 class ChainOfThought:
-    def __init__(self, client: APIClient):
+    SYSTEM_PROMPT = "You are a helpful assistant."
+    PROMPT = "{question}\n\nSolve this step by step. At the end, write your final answer clearly."
+    TEMPERATURE = 0.7
+    MAX_TOKENS = 2048
+
+    def __init__(self, client: APIClient, early_stop: bool = True):
         self.client = client
-    
+        # Stream the completion and hang up once the final answer line has
+        # been written, instead of waiting for the model to finish.
+        self.early_stop = early_stop
+
     def solve(self, question: str) -> Dict[str, Any]:
-        system = "You are a helpful assistant."
-        
-        prompt = f"{question}\n\nSolve this step by step. At the end, write your final answer clearly."
+        return run_sync(self.asolve(question))
+
+    def config(self) -> Dict[str, Any]:
+        # Everything that shapes this technique's requests; used to tell
+        # whether earlier results are still valid.
+        return {
+            "system": self.SYSTEM_PROMPT,
+            "prompt": self.PROMPT,
+            "temperature": self.TEMPERATURE,
+            "max_tokens": self.MAX_TOKENS,
+            "early_stop": self.early_stop,
+        }
+
+    async def asolve(self, question: str) -> Dict[str, Any]:
+        system = self.SYSTEM_PROMPT
+
+        prompt = self.PROMPT.format(question=question)
+
+        result = await self.client.acall(
+            prompt, system=system, temperature=self.TEMPERATURE, max_tokens=self.MAX_TOKENS,
+            stop_when=final_answer_emitted if self.early_stop else None, size_as="chain_of_thought"
+        )
 
-        result = self.client.call(prompt, system=system, temperature=0.7, max_tokens=2048)
-        
         if not result["ok"]:
             return {"answer": "", "full_response": ""}
-        
+
         full_response = result["text"]
         answer = extract_final_answer(full_response)
-        
+
         return {
             "answer": answer,
             "full_response": full_response
         }
 
 class SelfConsistency:
-    def __init__(self, client: APIClient):
+    SYSTEM_PROMPT = "You are a helpful assistant."
+    PROMPT = "{question}\n\nWork through this problem and give your answer."
+    TEMPERATURE = 0.8
+    MAX_TOKENS = 2048
+
+    def __init__(
+        self,
+        client: APIClient,
+        num_samples: int = 5,
+        fanout: int = 5,
+        adaptive: bool = False,
+        min_samples: int = 3,
+        max_samples: int = 9,
+        confidence: float = 0.8,
+    ):
         self.client = client
-    
+        self.num_samples = num_samples
+        # Maximum number of samples in flight at once; 1 restores the old
+        # one-after-another behaviour.
+        self.fanout = max(1, fanout)
+        # Adaptive voting draws samples in small rounds and stops once the
+        # leader cannot be overtaken within num_samples or holds at least
+        # `confidence` of the votes; a split vote at num_samples keeps
+        # sampling up to max_samples.
+        self.adaptive = adaptive
+        self.min_samples = max(1, min(min_samples, num_samples))
+        self.max_samples = max(max_samples, num_samples)
+        self.confidence = confidence
+
     def solve(self, question: str) -> Dict[str, Any]:
-        system = "You are a helpful assistant."
-        answers = []
-        
-        for i in range(5):
-            prompt = f"{question}\n\nWork through this problem and give your answer."
-            result = self.client.call(prompt, system=system, temperature=0.8, max_tokens=2048)
-            
-            if result["ok"]:
-                ans = extract_final_answer(result["text"])
-                answers.append(ans)
-        
-        from collections import Counter
+        return run_sync(self.asolve(question))
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            "system": self.SYSTEM_PROMPT,
+            "prompt": self.PROMPT,
+            "temperature": self.TEMPERATURE,
+            "max_tokens": self.MAX_TOKENS,
+            "num_samples": self.num_samples,
+            "adaptive": self.adaptive,
+            "min_samples": self.min_samples,
+            "max_samples": self.max_samples,
+            "confidence": self.confidence,
+        }
+
+    async def asolve(self, question: str) -> Dict[str, Any]:
+        system = self.SYSTEM_PROMPT
+        prompt = self.PROMPT.format(question=question)
+
+        if self.adaptive:
+            answers = await self._adaptive_vote(prompt, system)
+        else:
+            answers = [extract_final_answer(t) for t in await self._draw(prompt, system, self.num_samples)]
+
         counter = Counter(answers)
         most_common = counter.most_common(1)
-        
+
         if most_common:
             final_answer = most_common[0][0]
         else:
             final_answer = ""
-        
+
         return {
             "answer": final_answer,
             "all_answers": answers
         }
-    
+
+    async def _draw(self, prompt: str, system: str, count: int, first: int = 0) -> List[str]:
+        # first is the index of the first sample drawn here, so each sample
+        # has its own response cache entry
+        limit = asyncio.Semaphore(self.fanout)
+
+        async def sample(index: int) -> Dict[str, Any]:
+            async with limit:
+                return await self.client.acall(
+                    prompt, system=system, temperature=self.TEMPERATURE, max_tokens=self.MAX_TOKENS,
+                    size_as="self_consistency", sample=index
+                )
+
+        # Ask for every sample in one request when the server supports "n";
+        # anything it did not return is drawn with separate calls.
+        texts = []
+        if count > 1 and self.client.supports_n is not False:
+            result = await self.client.acall(
+                prompt, system=system, temperature=self.TEMPERATURE, max_tokens=self.MAX_TOKENS, n=count,
+                size_as="self_consistency", sample=first
+            )
+            if result["ok"]:
+                texts = result["texts"][:count]
+
+        # gather keeps the samples in request order, so the vote (and its
+        # tie-breaking) is the same as when they were drawn sequentially.
+        missing = count - len(texts)
+        budget = current_budget()
+        calls_left = budget.remaining_calls() if budget is not None else None
+        if calls_left is not None and calls_left < missing:
+            # Vote over fewer samples rather than run out mid-question
+            logger.info(f"Budget allows {calls_left} of {missing} remaining samples")
+            missing = max(0, calls_left)
+        start = first + len(texts)
+        results = await asyncio.gather(*[sample(start + i) for i in range(missing)])
+        texts.extend(r["text"] for r in results if r["ok"])
+        return texts
+
+    async def _adaptive_vote(self, prompt: str, system: str) -> List[str]:
+        answers: List[str] = []
+        target = self.num_samples
+        while True:
+            drawn = len(answers)
+            ranked = Counter(answers).most_common(2)
+            leader = ranked[0][1] if ranked else 0
+            runner_up = ranked[1][1] if len(ranked) > 1 else 0
+
+            if drawn >= self.min_samples and leader >= self.confidence * drawn:
+                break
+            if drawn >= target:
+                # A clear (unique, majority) leader ends the vote; a split
+                # one gets more samples, once.
+                if (leader > runner_up and leader * 2 > drawn) or target >= self.max_samples:
+                    break
+                target = self.max_samples
+            remaining = target - drawn
+            if drawn >= self.min_samples and leader > runner_up + remaining:
+                break
+
+            # Fewest further samples that could end the vote if they all
+            # agree with the leader
+            decide = (runner_up + remaining - leader) // 2 + 1
+            if self.confidence < 1:
+                decide = min(decide, max(1, -(-(self.confidence * drawn - leader) // (1 - self.confidence))))
+            batch = max(int(decide), self.min_samples - drawn, 1)
+            batch = min(batch, self.fanout, remaining)
+
+            texts = await self._draw(prompt, system, batch, first=drawn)
+            if not texts:
+                break
+            answers.extend(extract_final_answer(t) for t in texts)
+
+        logger.info(f"Adaptive vote stopped after {len(answers)} samples")
+        return answers
+
+
+_DEPENDS_RE = re.compile(r"\(\s*(?:depends on|uses|needs)\s*:?\s*(?:steps?\s*)?([^)]*)\)", re.IGNORECASE)
+_STEP_NUMBER_RE = re.compile(r"^\s*(?:step\s*)?(\d+)[.):]", re.IGNORECASE)
+
 
 class ProblemDecomposition:
-    def __init__(self, client: APIClient):
+    SYSTEM_PROMPT = "You are a helpful assistant."
+    DECOMPOSE_PROMPT = (
+        "Break down this problem into smaller steps:\n\n{question}\n\n"
+        "What steps do we need? Number each step. If a step needs the result of "
+        "earlier steps, end it with (depends on: N, M)."
+    )
+    STEP_PROMPT = "{step}\n\nAnswer this:"
+    SYNTHESIS_PROMPT = "What is the final answer to the original question?"
+    TEMPERATURE = 0.3
+    DECOMPOSE_MAX_TOKENS = 1024
+    STEP_MAX_TOKENS = 512
+    SYNTHESIS_MAX_TOKENS = 1024
+
+    def __init__(self, client: APIClient, max_steps: int = 4, early_stop: bool = True):
         self.client = client
-    
+        self.max_steps = max_steps
+        # Passed to the chain-of-thought fallback
+        self.early_stop = early_stop
+
     def solve(self, question: str) -> Dict[str, Any]:
-        system = "You are a helpful assistant."
-        
-        decompose_prompt = f"Break down this problem into smaller steps:\n\n{question}\n\nWhat steps do we need?"
-        
-        decompose_result = self.client.call(
-            decompose_prompt,
-            system=system,
-            temperature=0.3,
-            max_tokens=1024
-        )
-        
-        if not decompose_result["ok"]:
-            fallback = ChainOfThought(self.client)
-            return fallback.solve(question)
-        
-        steps_text = decompose_result["text"]
+        return run_sync(self.asolve(question))
+
+    @staticmethod
+    def parse_steps(steps_text: str, max_steps: int = 4) -> Tuple[List[str], List[List[int]]]:
+        # Returns the step texts and, for each step, the indices of earlier
+        # steps it depends on. Steps without a marker are independent.
         lines = [line.strip() for line in steps_text.split('\n') if line.strip()]
-        
+
         steps = []
+        numbers = []
+        raw_deps = []
         for line in lines:
-            cleaned = line.lstrip('0123456789.-) ')
+            number = _STEP_NUMBER_RE.match(line)
+            deps_match = _DEPENDS_RE.search(line)
+            deps = [int(d) for d in re.findall(r"\d+", deps_match.group(1))] if deps_match else []
+            cleaned = _DEPENDS_RE.sub("", line).strip().lstrip('0123456789.-) ')
             if len(cleaned) > 10:
                 steps.append(cleaned)
-        
-        if len(steps) > 4:
-            steps = steps[:4]
-        
+                numbers.append(int(number.group(1)) if number else None)
+                raw_deps.append(deps)
+
+        if all(n is None for n in numbers):
+            numbers = list(range(1, len(steps) + 1))
+
+        steps = steps[:max_steps]
+        position = {n: i for i, n in enumerate(numbers[:len(steps)]) if n is not None}
+        dependencies = []
+        for i, deps in enumerate(raw_deps[:len(steps)]):
+            dependencies.append(sorted({position[d] for d in deps if d in position and position[d] < i}))
+        return steps, dependencies
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            "system": self.SYSTEM_PROMPT,
+            "decompose_prompt": self.DECOMPOSE_PROMPT,
+            "step_prompt": self.STEP_PROMPT,
+            "synthesis_prompt": self.SYNTHESIS_PROMPT,
+            "temperature": self.TEMPERATURE,
+            "max_tokens": [self.DECOMPOSE_MAX_TOKENS, self.STEP_MAX_TOKENS, self.SYNTHESIS_MAX_TOKENS],
+            "max_steps": self.max_steps,
+            "early_stop": self.early_stop,
+        }
+
+    async def asolve(self, question: str) -> Dict[str, Any]:
+        system = self.SYSTEM_PROMPT
+
+        # Decomposing, one step and a synthesis is the least that is useful
+        budget = current_budget()
+        calls_left = budget.remaining_calls() if budget is not None else None
+        if calls_left is not None and calls_left < 3:
+            logger.info(f"Only {calls_left} calls left; using chain-of-thought instead of decomposition")
+            return await ChainOfThought(self.client, early_stop=self.early_stop).asolve(question)
+
+        decompose_prompt = self.DECOMPOSE_PROMPT.format(question=question)
+
+        decompose_result = await self.client.acall(
+            decompose_prompt,
+            system=system,
+            temperature=self.TEMPERATURE,
+            max_tokens=self.DECOMPOSE_MAX_TOKENS,
+            size_as="decompose"
+        )
+
+        if not decompose_result["ok"]:
+            fallback = ChainOfThought(self.client, early_stop=self.early_stop)
+            return await fallback.asolve(question)
+
+        # Keep one call for the synthesis; steps beyond what the budget can
+        # pay for are dropped (dependencies only point backwards, so the
+        # remaining prefix is still consistent).
+        max_steps = self.max_steps
+        budget = current_budget()
+        calls_left = budget.remaining_calls() if budget is not None else None
+        if calls_left is not None:
+            max_steps = min(max_steps, calls_left - 1)
+
+        steps, dependencies = self.parse_steps(decompose_result["text"], max(0, max_steps))
+
         if not steps:
-            fallback = ChainOfThought(self.client)
-            return fallback.solve(question)
-        
-        step_results = []
-        for step in steps:
-            step_prompt = f"{step}\n\nAnswer this:"
-            step_result = self.client.call(
+            fallback = ChainOfThought(self.client, early_stop=self.early_stop)
+            return await fallback.asolve(question)
+
+        # Each step starts as soon as the steps it depends on have finished,
+        # so independent steps run concurrently.
+        tasks: List[asyncio.Task] = []
+
+        async def run_step(i: int) -> Optional[str]:
+            known = await asyncio.gather(*[tasks[d] for d in dependencies[i]])
+            step_prompt = ""
+            if dependencies[i]:
+                step_prompt += "Known results:\n"
+                for d, r in zip(dependencies[i], known):
+                    if r is not None:
+                        step_prompt += f"- {steps[d]}: {r}\n"
+                step_prompt += "\n"
+            step_prompt += self.STEP_PROMPT.format(step=steps[i])
+            step_result = await self.client.acall(
                 step_prompt,
                 system=system,
-                temperature=0.3,
-                max_tokens=512
+                temperature=self.TEMPERATURE,
+                max_tokens=self.STEP_MAX_TOKENS,
+                size_as="step"
             )
-            if step_result["ok"]:
-                step_results.append(step_result["text"].strip())
-        
+            return step_result["text"].strip() if step_result["ok"] else None
+
+        for i in range(len(steps)):
+            tasks.append(asyncio.ensure_future(run_step(i)))
+        step_results = await asyncio.gather(*tasks)
+
         synthesis_prompt = f"Original question: {question}\n\n"
         synthesis_prompt += "Information gathered:\n"
-        
+
         for idx, (s, r) in enumerate(zip(steps, step_results)):
-            synthesis_prompt += f"{idx+1}. {s}\n{r}\n\n"
-        
-        synthesis_prompt += "What is the final answer to the original question?"
-        
-        synthesis_result = self.client.call(
+            if r is not None:
+                synthesis_prompt += f"{idx+1}. {s}\n{r}\n\n"
+
+        synthesis_prompt += self.SYNTHESIS_PROMPT
+
+        synthesis_result = await self.client.acall(
             synthesis_prompt,
             system=system,
-            temperature=0.3,
-            max_tokens=1024
+            temperature=self.TEMPERATURE,
+            max_tokens=self.SYNTHESIS_MAX_TOKENS,
+            size_as="synthesis"
         )
-        
+
         final_answer = ""
         if synthesis_result["ok"]:
             final_answer = extract_final_answer(synthesis_result["text"])
-        
+
         return {
             "answer": final_answer,
-            "steps": steps
+            "steps": steps,
+            "dependencies": dependencies
         }
-
@@ -3,6 +3,7 @@
 
 import logging
 from agent import ReasoningAgent
+from cli import env_settings
 
 logging.basicConfig(
     level=logging.INFO,
@@ -48,12 +49,8 @@ def test_agent():
     logger.info("="*60)
     
   
-    agent = ReasoningAgent(
-        api_key="cse476",
-        api_base="http://10.4.58.53:41701/v1",
-        model="bens_model",
-        max_calls_per_question=18
-    )
+    # Endpoint from REASONING_AGENT_API_BASE / _API_KEY / _MODEL if set
+    agent = ReasoningAgent(**env_settings())
     
     results = []
     
@@ -133,10 +130,11 @@ def test_api_connection():
     
     from api_client import APIClient
     
+    settings = env_settings()
     client = APIClient(
-        api_key="cse476",
-        api_base="http://10.4.58.53:41701/v1",
-        model="bens_model"
+        api_key=settings["api_key"],
+        api_base=settings["api_base"],
+        model=settings["model"]
     )
     
     try:
@@ -175,7 +173,7 @@ def main():
     
     logger.info("\nTesting complete!")
     logger.info("If all tests passed, you're ready to run on the full test set.")
-    logger.info("\nNext step: python generate_answers.py")
+    logger.info("\nNext step: python cli.py run")
 
 
 if __name__ == "__main__":
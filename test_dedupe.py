@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+# Tests for question deduplication in dedupe.py:
+# python -m unittest test_dedupe (or pytest).
+
+import unittest
+
+from dedupe import QuestionDeduper, normalize_question
+
+
+class NormalizeQuestionTest(unittest.TestCase):
+    def test_case_spacing_and_final_question_mark(self):
+        self.assertEqual(normalize_question("What is 2+2?"), normalize_question("what  is 2 + 2"))
+
+    def test_signs_and_factorials_are_kept(self):
+        self.assertNotEqual(normalize_question("-5 + 3 = ?"), normalize_question("5 + 3 = ?"))
+        self.assertNotEqual(normalize_question("Compute 5!"), normalize_question("Compute 5."))
+
+    def test_decimal_points_are_kept(self):
+        self.assertEqual(normalize_question("Pi is 3.14."), "pi is 3.14")
+
+
+class QuestionDeduperTest(unittest.TestCase):
+    def _assign(self, *questions):
+        deduper = QuestionDeduper()
+        return [deduper.assign(i, q, "math") for i, q in enumerate(questions, start=1)]
+
+    def test_sign_is_not_merged(self):
+        self.assertEqual(self._assign("-5 + 3 = ?", "5 + 3 = ?"), [None, None])
+
+    def test_factorial_is_not_merged(self):
+        self.assertEqual(self._assign("Compute 5!", "Compute 5."), [None, None])
+
+    def test_exact_duplicate_is_merged(self):
+        self.assertEqual(self._assign("What is 2+2?", "what is 2 + 2"), [None, (1, 1.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
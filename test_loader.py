@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+# Tests for the question loader and byte-offset index in loader.py:
+# python -m unittest test_loader (or pytest).
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from loader import QuestionIndex, iter_questions
+
+RECORDS = [{"input": f"What is {i} * 7?", "domain": "math"} for i in range(10)]
+
+
+class LoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name: str, text: str) -> Path:
+        path = self.dir / name
+        path.write_text(text, encoding="utf-8")
+        return path
+
+    def test_array_and_jsonl_give_the_same_records(self):
+        array = self._write("q.json", json.dumps(RECORDS, indent=2))
+        jsonl = self._write("q.jsonl", "".join(json.dumps(r) + "\n" for r in RECORDS))
+        self.assertEqual(list(iter_questions(array)), RECORDS)
+        self.assertEqual(list(iter_questions(jsonl)), RECORDS)
+
+    def test_bare_object_is_rejected(self):
+        for name, text in (("q.json", json.dumps(RECORDS[0])), ("q.jsonl", json.dumps(RECORDS[0], indent=2))):
+            with self.assertRaises(ValueError):
+                list(iter_questions(self._write(name, text)))
+
+    def test_index_slices_match_the_stream(self):
+        path = self._write("q.json", json.dumps(RECORDS, indent=2, ensure_ascii=False))
+        index = QuestionIndex.load_or_build(path)
+        self.assertEqual(len(index), len(RECORDS))
+        self.assertEqual(list(index.iter_range(3, 7)), RECORDS[3:7])
+        self.assertEqual(index[9], RECORDS[9])
+        self.assertTrue(QuestionIndex.index_path(path).exists())
+
+    def test_unsaved_index_still_works(self):
+        path = self._write("q.jsonl", "".join(json.dumps(r) + "\n" for r in RECORDS))
+        with mock.patch.object(QuestionIndex, "save", side_effect=PermissionError("read-only")):
+            index = QuestionIndex.load_or_build(path)
+        self.assertEqual(list(index.iter_range(8, 20)), RECORDS[8:])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+# Tests for the admission control in rate_limit.py:
+# python -m unittest test_rate_limit (or pytest).
+
+import asyncio
+import unittest
+
+from rate_limit import AIMDLimiter
+
+
+class AIMDLimiterTest(unittest.TestCase):
+    def test_cancelled_waiter_passes_its_slot_on(self):
+        async def run():
+            limiter = AIMDLimiter(initial=1, minimum=1, maximum=1)
+            await limiter.acquire()
+            first = asyncio.ensure_future(limiter.acquire())
+            second = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            # The freed slot goes to the first waiter, which is cancelled
+            # before its wakeup runs
+            limiter.release()
+            first.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await first
+            await asyncio.wait_for(second, 1)
+            return limiter.in_flight
+
+        self.assertEqual(asyncio.run(run()), 1)
+
+    def test_limit_is_enforced(self):
+        async def run():
+            limiter = AIMDLimiter(initial=2, minimum=1, maximum=2)
+            await limiter.acquire()
+            await limiter.acquire()
+            third = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0.01)
+            blocked = not third.done()
+            limiter.release()
+            await asyncio.wait_for(third, 1)
+            return blocked, limiter.in_flight
+
+        self.assertEqual(asyncio.run(run()), (True, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Tests for journaling and --resume in main_script.py, run against
+# mock_server.py: python -m unittest test_resume (or pytest).
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import main_script
+from agent import ReasoningAgent
+from journal import Journal
+from mock_server import MockServer
+
+QUESTIONS = [{"input": "What is 6 * 7?", "domain": "math"}]
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer(latency="fixed:0", error_rate=1.0).start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.journal = Path(self.tmp.name) / "journal.jsonl"
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def _run(self, resume: bool):
+        agent = ReasoningAgent(api_base=self.server.url, warmup_connections=0, strategy_model_path=None)
+        answers, _ = main_script.process_questions(QUESTIONS, agent, journal=Journal(self.journal), resume=resume)
+        return answers, agent.client.get_call_count()
+
+    def test_failed_answer_is_retried_on_resume(self):
+        answers, _ = self._run(resume=False)
+        self.assertFalse(main_script.reusable(Journal(self.journal).load()[1]))
+
+        # The outage is over
+        self.server.state.error_rate = 0.0
+        answers, calls = self._run(resume=True)
+        self.assertGreater(calls, 0)
+        self.assertEqual(answers[0]["output"], "42")
+        self.assertTrue(main_script.reusable(Journal(self.journal).load()[1]))
+
+        # A good answer is reused without asking again
+        answers, calls = self._run(resume=True)
+        self.assertEqual((answers[0]["output"], calls), ("42", 0))
+
+    def test_budget_exhausted_and_error_records_are_not_reused(self):
+        answer = {"output": "7"}
+        self.assertTrue(main_script.reusable({"answer": answer, "log": {}}))
+        self.assertFalse(main_script.reusable({"answer": {"output": ""}, "log": {}}))
+        self.assertFalse(main_script.reusable({"answer": {"output": "Error: Unable to generate answer"}}))
+        self.assertFalse(main_script.reusable({"answer": answer, "log": {"error": "boom"}}))
+        self.assertFalse(main_script.reusable({"answer": answer, "log": {"budget_exhausted": True}}))
+
+
+if __name__ == "__main__":
+    unittest.main()
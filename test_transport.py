@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+# Tests for the built-in HTTP/1.1 client in api_client.py, run against
+# mock_server.py: python -m unittest test_transport (or pytest).
+
+import os
+import asyncio
+import unittest
+from unittest import mock
+
+from api_client import (
+    APIClient, AsyncioTransport, RequestsTransport, HTTPProtocolError,
+    iter_sse, make_transport, proxy_for, run_sync, _iter_body,
+)
+from mock_server import MockServer
+from utils import final_answer_emitted
+
+HEADERS = {"Authorization": "Bearer test", "Content-Type": "application/json"}
+BODY = b'{"model": "m", "messages": [{"role": "user", "content": "What is 6 * 7?"}], "max_tokens": 64}'
+
+
+async def _chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+def _reader(data: bytes) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+class ChunkedAndSSEParsingTest(unittest.TestCase):
+    def test_chunked_body_with_extension_and_trailer(self):
+        async def read():
+            reader = _reader(b"5;ext=1\r\nhello\r\n7\r\n, world\r\n0\r\nX-Trailer: 1\r\n\r\nNEXT")
+            body = b"".join([c async for c in _iter_body(reader, {"transfer-encoding": "chunked"})])
+            # The next response on the connection is left unread
+            return body, await reader.read()
+
+        self.assertEqual(run_sync(read()), (b"hello, world", b"NEXT"))
+
+    def test_content_length_body_stops_at_length(self):
+        async def read():
+            reader = _reader(b"abcdefNEXT")
+            return b"".join([c async for c in _iter_body(reader, {"Content-Length": "6"})])
+
+        self.assertEqual(run_sync(read()), b"abcdef")
+
+    def test_sse_events_split_across_chunks(self):
+        async def events():
+            chunks = _chunks(b"data: {\"a\"", b": 1}\r\n\r\nda", b"ta: x\ndata: y\n\n: comment\n\n", b"data: [DONE]\n\n")
+            return [e async for e in iter_sse(chunks)]
+
+        self.assertEqual(run_sync(events()), ['{"a": 1}', "x\ny", "[DONE]"])
+
+
+class AsyncioTransportTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer(latency="fixed:0").start()
+        self.url = f"{self.server.url}/chat/completions"
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_keep_alive_connection_is_reused(self):
+        transport = AsyncioTransport(pool_size=4)
+
+        async def post_three():
+            return [await transport.post(self.url, HEADERS, BODY) for _ in range(3)]
+
+        responses = run_sync(post_three())
+        self.assertEqual([status for status, _, _ in responses], [200, 200, 200])
+        stats = transport.stats()
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertEqual(stats["reused"], 2)
+
+    def test_streamed_completion_is_decoded(self):
+        client = APIClient("test", self.server.url, "m", pool_size=2)
+        full = client.call("What is 6 * 7?", temperature=0.0, max_tokens=256, use_cache=False)
+
+        async def collect():
+            return "".join([d async for d in client.astream("What is 6 * 7?", max_tokens=256)])
+
+        self.assertEqual(run_sync(collect()), full["text"])
+        self.assertEqual(self.server.stats().get("streamed"), 1)
+
+    def test_stream_stops_early(self):
+        client = APIClient("test", self.server.url, "m", pool_size=2)
+        result = client.call("What is 6 * 7?", max_tokens=256, stop_when=final_answer_emitted, use_cache=False)
+        self.assertTrue(result["ok"])
+        self.assertTrue(result["stopped_early"])
+        self.assertIn("final answer", result["text"].lower())
+
+
+class AstreamTest(unittest.TestCase):
+    def test_requests_transport_yields_whole_text(self):
+        server = MockServer(latency="fixed:0").start()
+        try:
+            client = APIClient("test", server.url, "m", transport="requests", pool_size=2)
+
+            async def collect():
+                return [d async for d in client.astream("What is 6 * 7?", max_tokens=256)]
+
+            deltas = run_sync(collect())
+            self.assertEqual(len(deltas), 1)
+            self.assertEqual(deltas[0], client.call("What is 6 * 7?", max_tokens=256, use_cache=False)["text"])
+        finally:
+            server.stop()
+
+    def test_slow_response_times_out(self):
+        server = MockServer(latency="fixed:2").start()
+        try:
+            client = APIClient("test", server.url, "m", pool_size=2)
+
+            async def collect():
+                return [d async for d in client.astream("What is 6 * 7?", max_tokens=256, timeout=0.2)]
+
+            with self.assertRaises(asyncio.TimeoutError):
+                run_sync(collect())
+        finally:
+            server.stop()
+
+
+class RequestsTransportTest(unittest.TestCase):
+    def test_in_flight_count_settles_after_concurrent_posts(self):
+        server = MockServer(latency="fixed:0.01").start()
+        try:
+            transport = RequestsTransport(pool_size=8)
+            url = f"{server.url}/chat/completions"
+
+            async def post_many():
+                return await asyncio.gather(*[transport.post(url, HEADERS, BODY) for _ in range(64)])
+
+            responses = run_sync(post_many())
+            self.assertEqual({status for status, _, _ in responses}, {200})
+            self.assertEqual(transport.in_flight, 0)
+            self.assertLessEqual(transport.stats()["open_connections"], 8)
+        finally:
+            server.stop()
+
+
+class DroppedIdleConnectionTest(unittest.TestCase):
+    # A server that answers one request per connection and then drops the
+    # connection when the next request arrives, the way servers close idle
+    # keep-alive connections.
+    RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n{}"
+
+    async def _handle(self, reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        await reader.readexactly(len(BODY))
+        writer.write(self.RESPONSE)
+        await writer.drain()
+        await reader.readuntil(b"\r\n\r\n")
+        writer.close()
+
+    def test_request_is_retried_on_a_fresh_connection(self):
+        transport = AsyncioTransport(pool_size=4)
+
+        async def run():
+            server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+            url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/v1/chat/completions"
+            try:
+                return [await transport.post(url, HEADERS, BODY) for _ in range(2)]
+            finally:
+                server.close()
+
+        responses = run_sync(run())
+        self.assertEqual([status for status, _, _ in responses], [200, 200])
+        self.assertEqual(transport.stats()["connections_opened"], 2)
+
+    def test_fresh_connection_failure_is_not_retried(self):
+        async def refuse(reader, writer):
+            writer.close()
+
+        transport = AsyncioTransport(pool_size=4)
+
+        async def run():
+            server = await asyncio.start_server(refuse, "127.0.0.1", 0)
+            url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/v1/chat/completions"
+            try:
+                await transport.post(url, HEADERS, BODY)
+            finally:
+                server.close()
+
+        with self.assertRaises((HTTPProtocolError, OSError)):
+            run_sync(run())
+        self.assertEqual(transport.stats()["connections_opened"], 1)
+
+
+class ProxySelectionTest(unittest.TestCase):
+    URL = "http://model.example:8000/v1/chat/completions"
+
+    def test_proxy_environment_selects_requests_transport(self):
+        with mock.patch.dict(os.environ, {"http_proxy": "http://proxy.example:3128", "no_proxy": ""}):
+            self.assertEqual(proxy_for(self.URL), "http://proxy.example:3128")
+            self.assertIsInstance(make_transport(None, [self.URL]), RequestsTransport)
+            # An explicit choice wins
+            self.assertIsInstance(make_transport("asyncio", [self.URL]), AsyncioTransport)
+
+    def test_no_proxy_keeps_asyncio_transport(self):
+        env = {"http_proxy": "http://proxy.example:3128", "no_proxy": "model.example"}
+        with mock.patch.dict(os.environ, env):
+            self.assertIsNone(proxy_for(self.URL))
+            self.assertIsInstance(make_transport(None, [self.URL]), AsyncioTransport)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import json
+import math
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Dict, Any, Deque, Optional, Tuple
+
+
+class MaxTokensSizer:
+    # Learns how long completions are for each (domain, call kind) and sizes
+    # max_tokens at a high percentile of what has been seen, plus headroom,
+    # instead of always reserving the technique's ceiling. Until a kind has
+    # `min_samples` observations the ceiling is used unchanged. A sized
+    # request that is cut off is retried by the client at the ceiling.
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        headroom: float = 1.25,
+        min_samples: int = 20,
+        window: int = 256,
+        granularity: int = 64,
+    ):
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.window = window
+        self.granularity = granularity
+        self._lengths: Dict[Tuple[str, str], Deque[int]] = {}
+        self._counts: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(domain: Optional[str], kind: str) -> Tuple[str, str]:
+        return (domain or "unknown", kind)
+
+    def size(self, domain: Optional[str], kind: str, ceiling: int) -> int:
+        key = self._key(domain, kind)
+        with self._lock:
+            lengths = self._lengths.get(key)
+            if lengths is None or len(lengths) < self.min_samples:
+                return ceiling
+            ordered = sorted(lengths)
+        # Nearest-rank percentile, rounded up to whole granules
+        rank = max(0, min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1))
+        sized = math.ceil(ordered[rank] * self.headroom / self.granularity) * self.granularity
+        return max(self.granularity, min(ceiling, sized))
+
+    def observe(self, domain: Optional[str], kind: str, completion_tokens: int) -> None:
+        key = self._key(domain, kind)
+        with self._lock:
+            lengths = self._lengths.get(key)
+            if lengths is None:
+                lengths = self._lengths[key] = deque(maxlen=self.window)
+            lengths.append(completion_tokens)
+            self._count(key, "requests")
+
+    def record_truncation(self, domain: Optional[str], kind: str) -> None:
+        with self._lock:
+            self._count(self._key(domain, kind), "truncated")
+
+    def _count(self, key: Tuple[str, str], name: str) -> None:
+        counts = self._counts.setdefault(key, {"requests": 0, "truncated": 0})
+        counts[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            keys = sorted(set(self._lengths) | set(self._counts))
+            items = [(key, list(self._lengths.get(key, ())), dict(self._counts.get(key, {}))) for key in keys]
+        out = {}
+        for (domain, kind), lengths, counts in items:
+            out[f"{domain}/{kind}"] = {
+                "observed": len(lengths),
+                "requests": counts.get("requests", 0),
+                "truncated_retries": counts.get("truncated", 0),
+                "mean_tokens": round(sum(lengths) / len(lengths), 1) if lengths else 0.0,
+                "max_tokens": self.size(domain, kind, 1 << 30) if len(lengths) >= self.min_samples else None,
+            }
+        return out
+
+    def save(self, path: Path) -> None:
+        with self._lock:
+            lengths = {f"{d}/{k}": list(v) for (d, k), v in self._lengths.items()}
+        with Path(path).open("w") as fp:
+            json.dump({"version": 1, "lengths": lengths}, fp)
+
+    def load(self, path: Path) -> None:
+        # Adds earlier runs' observations to this sizer's windows
+        with Path(path).open("r") as fp:
+            data = json.load(fp)
+        with self._lock:
+            for name, values in data.get("lengths", {}).items():
+                domain, _, kind = name.partition("/")
+                lengths = self._lengths.setdefault((domain, kind), deque(maxlen=self.window))
+                lengths.extend(int(v) for v in values)
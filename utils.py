@@ -1,85 +1,136 @@
 import re
-from typing import Optional
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Iterable, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+_NUMBER_RE = re.compile(r"[-+]?\d*\.?\d+")
+_UNSIGNED_RE = re.compile(r'\d+\.?\d*')
+_LETTER_RE = re.compile(r'\b([A-E])\b')
+_CHOICE_PATTERNS = [
+    re.compile(r"answer is ([A-E])\b", re.IGNORECASE | re.MULTILINE),
+    re.compile(r"answer: ([A-E])\b", re.IGNORECASE | re.MULTILINE),
+    re.compile(r"^([A-E])\s*$", re.IGNORECASE | re.MULTILINE),
+]
+_PHRASE_PATTERNS = [
+    re.compile(r"answer[:\s]+(.+?)[\.\n]", re.IGNORECASE),
+    re.compile(r"therefore[,\s]+(.+?)[\.\n]", re.IGNORECASE),
+    re.compile(r"thus[,\s]+(.+?)[\.\n]", re.IGNORECASE),
+]
+_SENTENCE_SPLIT_RE = re.compile(r'[.!?]+')
+_BAD_WORDS = ('need', 'should', 'because', 'since', 'if', 'when')
 
 
 def extract_number(text: str) -> Optional[str]:
     if not text:
         return None
-    match = re.search(r"[-+]?\d*\.?\d+", text)
+    match = _NUMBER_RE.search(text)
     return match.group(0) if match else None
 
 
-def extract_final_answer(text: str) -> str:
+def _last_sentences(text: str, count: int = 3) -> List[str]:
+    # Same result as the tail of [s.strip() for s in re.split(...) if
+    # s.strip()], but only splits as much of the end of the text as needed.
+    window = 256
+    while True:
+        whole = window >= len(text)
+        pieces = _SENTENCE_SPLIT_RE.split(text if whole else text[-window:])
+        if not whole:
+            # The first piece may be cut off by the window
+            pieces = pieces[1:]
+        sentences = [p for p in (piece.strip() for piece in pieces) if p]
+        if whole or len(sentences) >= count:
+            return sentences[-count:]
+        window *= 4
+
+
+def _extract_with_rule(text: str) -> Tuple[str, str]:
+    # Rules are tried in priority order; each one only looks at the lines it
+    # needs, and every pattern is compiled once at import time. Also returns
+    # the name of the rule that matched, which says how explicit the answer was.
     if not text:
-        return ""
-    
-    text = text.strip()
-    text = re.sub(r'\*\*', '', text)
-    text = re.sub(r'__', '', text)
+        return "", "empty"
     
+    text = text.strip().replace('**', '').replace('__', '')
     lines = text.split('\n')
     
     for line in reversed(lines[-5:]):
-        line_lower = line.lower().strip()
+        line_lower = line.lower()
         if 'total' in line_lower or 'final' in line_lower:
-            nums = re.findall(r'\d+\.?\d*', line)
+            nums = _UNSIGNED_RE.findall(line)
             if nums:
-                return nums[-1]
+                return nums[-1], "final_line"
     
     for line in reversed(lines[-3:]):
         line = line.strip()
-        if len(line) > 2 and len(line) < 40:
-            letter = re.search(r'\b([A-E])\b', line)
+        if 2 < len(line) < 40:
+            letter = _LETTER_RE.search(line)
             if letter:
-                return letter.group(1)
-    
-    patterns = [
-        r"answer is ([A-E])\b",
-        r"answer: ([A-E])\b",
-        r"^([A-E])\s*$",
-    ]
+                return letter.group(1), "choice_line"
     
-    for p in patterns:
-        m = re.search(p, text, re.IGNORECASE | re.MULTILINE)
+    for pattern in _CHOICE_PATTERNS:
+        m = pattern.search(text)
         if m:
-            return m.group(1).upper()
+            return m.group(1).upper(), "choice_phrase"
     
     for line in reversed(lines[-4:]):
-        if '=' in line:
-            parts = line.split('=')
-            if len(parts) >= 2:
-                last_part = parts[-1].strip()
-                num = re.search(r'\d+\.?\d*', last_part)
-                if num:
-                    return num.group(0)
-    
-    patterns2 = [
-        r"answer[:\s]+(.+?)[\.\n]",
-        r"therefore[,\s]+(.+?)[\.\n]",
-        r"thus[,\s]+(.+?)[\.\n]",
-    ]
-    
-    for p in patterns2:
-        m = re.search(p, text, re.IGNORECASE)
+        eq = line.rfind('=')
+        if eq >= 0:
+            num = _UNSIGNED_RE.search(line, eq + 1)
+            if num:
+                return num.group(0), "equation"
+    
+    for pattern in _PHRASE_PATTERNS:
+        m = pattern.search(text)
         if m:
             ans = m.group(1).strip()
             if len(ans) < 80:
-                return ans
+                return ans, "phrase"
     
-    sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
+    sentences = _last_sentences(text)
     
     if not sentences:
-        return text
+        return text, "fallback"
     
-    for s in reversed(sentences[-3:]):
+    for s in reversed(sentences):
         if len(s) > 120:
             continue
-        bad_words = ['need', 'should', 'because', 'since', 'if', 'when']
-        if any(w in s.lower() for w in bad_words):
+        s_lower = s.lower()
+        if any(w in s_lower for w in _BAD_WORDS):
             continue
-        return s
+        return s, "sentence"
     
-    return sentences[-1] if sentences else text
+    return sentences[-1], "fallback"
+
+
+def _extract_final_answer(text: str) -> str:
+    return _extract_with_rule(text)[0]
+
+
+# The same text is often extracted more than once (clean_output, repeated
+# self-consistency samples, re-scoring logs), so results are memoised.
+extract_final_answer = lru_cache(maxsize=1024)(_extract_final_answer)
+extract_answer_and_rule = lru_cache(maxsize=1024)(_extract_with_rule)
+
+
+_FINAL_LINE_RE = re.compile(
+    r"\b(?:final answer|the answer)\s*(?:is\b|:)\s*\S|^\W*answer\s*:\s*\S|\\boxed\{[^}]+\}",
+    re.IGNORECASE
+)
+
+
+def final_answer_emitted(text: str) -> bool:
+    # Stop predicate for streamed completions: true once the most recent
+    # complete line states the final answer.
+    end = text.rfind('\n')
+    if end < 0:
+        return False
+    start = text.rfind('\n', 0, end) + 1
+    return bool(_FINAL_LINE_RE.search(text[start:end]))
 
 
 def normalize_answer(text: str) -> str:
@@ -93,20 +144,24 @@ def normalize_answer(text: str) -> str:
     return text
 
 
+_LEAD_IN_RE = re.compile(r'^(answer is|answer:|therefore|thus|so)\s*', re.IGNORECASE)
+_SINGLE_LETTER_RE = re.compile(r'^[A-E]$')
+_PLAIN_NUMBER_RE = re.compile(r'^\$?([\d,]+\.?\d*)$')
+
+
 def clean_output(text: str, max_length: int = 200) -> str:
     if not text:
         return ""
     
     answer = extract_final_answer(text)
     
-    answer = re.sub(r'\*\*', '', answer)
-    answer = re.sub(r'__', '', answer)
-    answer = re.sub(r'^(answer is|answer:|therefore|thus|so)\s*', '', answer, flags=re.IGNORECASE)
+    answer = answer.replace('**', '').replace('__', '')
+    answer = _LEAD_IN_RE.sub('', answer, count=1)
     
-    if re.match(r'^[A-E]$', answer):
+    if _SINGLE_LETTER_RE.match(answer):
         return answer
     
-    m = re.match(r'^\$?([\d,]+\.?\d*)$', answer.strip())
+    m = _PLAIN_NUMBER_RE.match(answer.strip())
     if m:
         return m.group(1)
     
@@ -115,7 +170,7 @@ def clean_output(text: str, max_length: int = 200) -> str:
         if num:
             return num
         
-        sents = [s.strip() for s in re.split(r'[.!?]+', answer) if s.strip()]
+        sents = [s.strip() for s in _SENTENCE_SPLIT_RE.split(answer) if s.strip()]
         if sents:
             answer = sents[0]
         
@@ -123,3 +178,21 @@ def clean_output(text: str, max_length: int = 200) -> str:
             answer = answer[:max_length].strip()
     
     return answer.strip()
+
+
+def ordered_map(fn: Callable[[T], R], items: Iterable[T], workers: int = 1) -> Iterator[R]:
+    # Runs fn over items on a bounded thread pool and yields results in input
+    # order. At most 2 * workers items are in flight at any time.
+    if workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()